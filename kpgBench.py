@@ -0,0 +1,134 @@
+# kpgBench - time each phase of kpgCheck on synthetic KPG-D1N exports of increasing size
+
+# For each size, kpgGen.py writes an export and a modified copy of it (for the comparison phase)
+#  into a temporary directory, then each phase is timed separately: parsing (with each parser),
+#  .csv generation, building the channel indexes, each internal consistency rule, and the two-file
+#  comparison.  The parse cache is not used.  Each phase is run --repeat times (default 3) and the
+#  best time is kept.  Results are written as JSON, so that runs can be compared over time; with --baseline,
+#  phases that are slower than the same phase in a previous results file are reported (and the exit
+#  status is 1), to catch performance regressions.
+
+import sys
+import os
+import time
+import json
+import platform
+import logging
+import tempfile
+
+import kpgCheck
+from kpgGen import generateExport
+
+DEFAULT_SIZES=[100,1000,5000,10000,50000]
+CHANNELS_PER_ZONE=50
+# BeautifulSoup parsing is slow and takes a lot of memory on large files; only time it up to this size
+DEFAULT_SOUP_MAX_CHANNELS=10000
+# differences smaller than NOISE_SECONDS plus NOISE_FRACTION of the baseline time are treated as
+#  timing noise when checking for regressions, however small --tolerance is: run-to-run variation
+#  grows with the length of a phase, so a fixed floor alone only covers the shortest phases
+NOISE_SECONDS=0.01
+NOISE_FRACTION=0.1
+DEFAULT_REPEAT=3
+
+# best wall time of repeat calls to function; returns [seconds,result of the last call]
+def timed(function,repeat=1):
+    best=None
+    result=None
+    for n in range(repeat):
+        t0=time.perf_counter()
+        result=function()
+        t=time.perf_counter()-t0
+        if best is None or t<best:
+            best=t
+    return [best,result]
+
+def benchmarkSize(channels,workDir,repeat=DEFAULT_REPEAT,soupMaxChannels=DEFAULT_SOUP_MAX_CHANNELS):
+    zones=max(1,-(-channels//CHANNELS_PER_ZONE))
+    channelsPerZone=min(channels,CHANNELS_PER_ZONE)
+    fileName1=os.path.join(workDir,'bench'+str(channels)+'.htm')
+    fileName2=os.path.join(workDir,'bench'+str(channels)+'.modified.htm')
+    synonymsFileName=os.path.join(workDir,'bench'+str(channels)+'.synonyms.txt')
+    generateExport(fileName1,zones,channelsPerZone,seed=channels,synonymsFileName=synonymsFileName)
+    generateExport(fileName2,zones,channelsPerZone,seed=channels,changeRate=0.02)
+    seconds={}
+    parsers=['stream']
+    if channels<=soupMaxChannels:
+        parsers.append('soup')
+    for parser in parsers:
+        [seconds['parse_'+parser],kwFile1]=timed(lambda: kpgCheck.KWFile(fileName1,parser=parser),repeat)
+    kwFile2=kpgCheck.KWFile(fileName2,parser='stream')
+    [chanFileName,otherFileName]=kpgCheck.getOutputFileNames(fileName1)
+    [seconds['csv'],r]=timed(lambda: [kpgCheck.writeChannelCsv(kwFile1,chanFileName),kpgCheck.writeOtherTablesCsv(kwFile1,otherFileName)],repeat)
+    [seconds['indexes'],indexes]=timed(lambda: kpgCheck.ChannelIndexes(kwFile1.getAllChannelDicts(),kpgCheck.rules),repeat)
+    context=kpgCheck.CheckContext(kpgCheck.SynonymIndex([synonymsFileName]))
+    for ruleNum in range(len(kpgCheck.rules)):
+        rule=kpgCheck.rules[ruleNum]
+        [seconds['check_part'+str(ruleNum+1)],r]=timed(lambda: rule.check(indexes,context),repeat)
+    [seconds['compare'],r]=timed(lambda: kpgCheck.compareFiles(kwFile1,kwFile2),repeat)
+    return {
+        'channels':len(kwFile1.getAllChannelDicts()),
+        'zones':zones,
+        'fileBytes':os.path.getsize(fileName1),
+        'optionalFeaturesTables':len(kwFile1.getOptionalFeaturesTables()),
+        'seconds':seconds}
+
+# list of [channels,phase,baseline seconds,seconds] for phases that are slower than in the baseline
+def findRegressions(results,baseline,tolerance):
+    regressions=[]
+    baselineBySize={r['channels']:r for r in baseline['results']}
+    for r in results['results']:
+        b=baselineBySize.get(r['channels'])
+        if not b:
+            continue
+        for [phase,t] in r['seconds'].items():
+            bt=b['seconds'].get(phase)
+            if bt is not None and t>bt*(1+tolerance) and t-bt>NOISE_SECONDS+NOISE_FRACTION*bt:
+                regressions.append([r['channels'],phase,bt,t])
+    return regressions
+
+if __name__=="__main__":
+    # kpgCheck logs its progress messages to the root logger; keep those out of the benchmark output
+    logging.basicConfig(level=logging.WARNING,format='%(message)s')
+    log=logging.getLogger('kpgBench')
+    log.setLevel(logging.INFO)
+    import argparse
+    argParser=argparse.ArgumentParser(description='Time each phase of kpgCheck on synthetic exports of increasing size.')
+    argParser.add_argument('--sizes',type=int,nargs='+',default=DEFAULT_SIZES,metavar='N',
+            help='numbers of channels to benchmark (default: '+' '.join([str(n) for n in DEFAULT_SIZES])+')')
+    argParser.add_argument('--repeat',type=int,default=DEFAULT_REPEAT,help='run each phase this many times, and keep the best time (default: '+str(DEFAULT_REPEAT)+')')
+    argParser.add_argument('--soup-max',type=int,default=DEFAULT_SOUP_MAX_CHANNELS,metavar='N',
+            help='only time the BeautifulSoup parser for files with up to this many channels (default: '+str(DEFAULT_SOUP_MAX_CHANNELS)+')')
+    argParser.add_argument('--output',default='kpgBench.json',help='results file to write (default: kpgBench.json)')
+    argParser.add_argument('--baseline',metavar='FILE',help='previous results file; report phases that are slower than in that file')
+    argParser.add_argument('--tolerance',type=float,default=0.25,help='fraction slower than the baseline that counts as a regression (default: 0.25)')
+    args=argParser.parse_args()
+
+    results={
+        'tool':'kpgBench',
+        'runTime':time.strftime('%Y-%m-%d %H:%M:%S',time.localtime()),
+        'python':platform.python_version(),
+        'platform':platform.platform(),
+        'parserVersion':kpgCheck.PARSER_VERSION,
+        'repeat':args.repeat,
+        'results':[]}
+    with tempfile.TemporaryDirectory(prefix='kpgBench') as workDir:
+        for size in args.sizes:
+            log.info('Benchmarking '+str(size)+' channels...')
+            r=benchmarkSize(size,workDir,args.repeat,args.soup_max)
+            results['results'].append(r)
+            for [phase,t] in r['seconds'].items():
+                log.info('  %-16s %10.4f s' % (phase,t))
+    with open(args.output,'w') as f:
+        json.dump(results,f,indent=2)
+    log.info('Results written to '+args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline=json.load(f)
+        regressions=findRegressions(results,baseline,args.tolerance)
+        if regressions:
+            log.info('Regressions compared to '+args.baseline+' (more than '+str(int(args.tolerance*100))+'% slower):')
+            for [channels,phase,bt,t] in regressions:
+                log.info('  %6d channels  %-16s %10.4f s -> %10.4f s' % (channels,phase,bt,t))
+            sys.exit(1)
+        log.info('No regressions compared to '+args.baseline)
@@ -9,75 +9,280 @@ import csv
 import time
 import os
 import logging
+import contextlib
+import re
+import hashlib
+import pickle
+import zlib
+import bisect
+import itertools
+from html.parser import HTMLParser
+from collections.abc import Mapping
+from array import array
 
-logging.basicConfig(
-        level=logging.INFO,
-        # format='%(asctime)s %(message)s',
-        format='%(message)s',
-        handlers=[
-            logging.FileHandler('kpgCheck.log','w'),
-            logging.StreamHandler()
-        ]
-)
+# Per-phase instrumentation for a run: wall time, CPU time, and memory of each phase (parsing,
+#  extraction, .csv generation, each check, comparison, ...), collected into a machine-readable report.
+#  - memory is the resident set size (working set on Windows) before and after the phase, and the
+#     process peak resident set size so far (a high-water mark for the whole process, not just the
+#     phase), where the platform provides them; only with traceMemory is there a true peak for the phase itself: the peak python allocation
+#     during the phase, measured with tracemalloc (which slows the run down)
+#  - with profilePhase, each phase whose name starts with profilePhase is run under cProfile, and the
+#     stats of all such phases are accumulated into self.profile
+#  - cProfile and tracemalloc's peak are process-wide, so phases can only be timed concurrently (see
+#     runRules) when neither is in use; sequentialPhases() says when they must run one at a time
+#  - the module-level runReport is used by KWFile and processFile; it is disabled unless replaced
+class RunReport():
+    def __init__(self,enabled=True,traceMemory=False,profilePhase=None):
+        self.enabled=enabled
+        self.traceMemory=traceMemory
+        self.profilePhase=profilePhase
+        self.profile=None
+        self.phases=[] # list of dicts, in the order the phases finished
+        self.files=[] # list of dicts of per-file counts
+        self.startWall=time.perf_counter()
+        self.startCpu=time.process_time()
+        if traceMemory:
+            import tracemalloc
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self,name,fileName=None):
+        if not self.enabled:
+            yield
+            return
+        profile=None
+        if self.profilePhase and name.startswith(self.profilePhase):
+            if not self.profile:
+                import cProfile
+                self.profile=cProfile.Profile()
+            profile=self.profile
+        if self.traceMemory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        rss0=currentRss()
+        wall0=time.perf_counter()
+        cpu0=time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            p={
+                'phase':name,
+                'file':fileName,
+                'wallSeconds':round(time.perf_counter()-wall0,6),
+                'cpuSeconds':round(time.process_time()-cpu0,6),
+                'rssBeforeBytes':rss0,
+                'rssAfterBytes':currentRss(),
+                'processPeakRssBytes':peakRss()}
+            if self.traceMemory:
+                import tracemalloc
+                p['peakTracedBytes']=tracemalloc.get_traced_memory()[1]
+            self.phases.append(p)
+
+    def sequentialPhases(self):
+        return self.enabled and (self.traceMemory or bool(self.profilePhase))
+
+    def addFile(self,info):
+        if self.enabled:
+            self.files.append(info)
+
+    def addPhases(self,phases):
+        if self.enabled:
+            self.phases+=phases
+
+    def toDict(self):
+        return {
+            'tool':'kpgCheck',
+            'runTime':time.strftime('%Y-%m-%d %H:%M:%S',time.localtime()),
+            'parserVersion':PARSER_VERSION,
+            'totalWallSeconds':round(time.perf_counter()-self.startWall,6),
+            'totalCpuSeconds':round(time.process_time()-self.startCpu,6),
+            'peakRssBytes':peakRss(),
+            'files':self.files,
+            'phases':self.phases}
+
+    # total wall time per phase name, for the log summary
+    def phaseTotals(self):
+        totals={}
+        for p in self.phases:
+            totals[p['phase']]=totals.get(p['phase'],0)+p['wallSeconds']
+        return totals
+
+runReport=RunReport(enabled=False)
+
+# [working set size, peak working set size] of this process in bytes on Windows (its equivalents of the
+#  current and peak resident set size), from GetProcessMemoryInfo; None if the call fails
+windowsMemoryApi=None # [GetProcessMemoryInfo,current process handle,PROCESS_MEMORY_COUNTERS], set up on first use
+def windowsMemoryInfo():
+    global windowsMemoryApi
+    import ctypes
+    if not windowsMemoryApi:
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_=[('cb',wintypes.DWORD),('PageFaultCount',wintypes.DWORD)]+[(name,ctypes.c_size_t) for name in
+                    ['PeakWorkingSetSize','WorkingSetSize','QuotaPeakPagedPoolUsage','QuotaPagedPoolUsage',
+                    'QuotaPeakNonPagedPoolUsage','QuotaNonPagedPoolUsage','PagefileUsage','PeakPagefileUsage']]
+        kernel32=ctypes.WinDLL('kernel32')
+        kernel32.GetCurrentProcess.restype=wintypes.HANDLE
+        try:
+            getProcessMemoryInfo=kernel32.K32GetProcessMemoryInfo
+        except AttributeError: # before Windows 7 it is only in psapi.dll
+            getProcessMemoryInfo=ctypes.WinDLL('psapi').GetProcessMemoryInfo
+        getProcessMemoryInfo.argtypes=[wintypes.HANDLE,ctypes.c_void_p,wintypes.DWORD]
+        getProcessMemoryInfo.restype=wintypes.BOOL
+        windowsMemoryApi=[getProcessMemoryInfo,kernel32.GetCurrentProcess(),PROCESS_MEMORY_COUNTERS]
+    [getProcessMemoryInfo,process,PROCESS_MEMORY_COUNTERS]=windowsMemoryApi
+    counters=PROCESS_MEMORY_COUNTERS()
+    counters.cb=ctypes.sizeof(counters)
+    if not getProcessMemoryInfo(process,ctypes.byref(counters),counters.cb):
+        return None
+    return [counters.WorkingSetSize,counters.PeakWorkingSetSize]
+
+# current resident set size of this process in bytes, or None if not available on this platform
+def currentRss():
+    if sys.platform=='win32':
+        info=windowsMemoryInfo()
+        return info[0] if info else None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError,ValueError,AttributeError,IndexError):
+        return None
+
+# peak resident set size of this process so far in bytes, or None if not available on this platform
+def peakRss():
+    if sys.platform=='win32':
+        info=windowsMemoryInfo()
+        return info[1] if info else None
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform=='darwin' else maxrss*1024 # bytes on macOS, KiB elsewhere
+
+# when parser='auto', files larger than this are read with the streaming parser rather than
+#  BeautifulSoup; the full BeautifulSoup tree takes many times the size of the file in memory
+STREAMING_THRESHOLD_BYTES=1024*1024
+# the streaming parser is fed the file in chunks of this many characters
+STREAM_CHUNK_CHARS=65536
+
+# version of the extracted data layout; bump this whenever KWFile's parse results change, so that
+#  entries written to the parse cache by an older version are not used
+PARSER_VERSION='3'
 
 class KWFile():
-    def __init__(self,fileName=None,parent=None):
+    def __init__(self,fileName=None,parent=None,parser='auto',cache=None):
+        self.fileName=fileName
         self.extension=os.path.splitext(fileName)[1].lower()
-        self.soup=None
-        self.allChannelDicts=[] # list of dictionaries, one per html channel entry (preserve duplicates)
-        self.optionalFeaturesTables=[] # list of lists, one entry per Optional Features table [name,table]
+        self.soup=None # BeautifulSoup tree, only while parseSoup is extracting from it
+        self.heading=None # string of the first h1 in the file, identifying the tool that exported it
+        self.allChannelDicts=ChannelTable() # one entry per html channel entry (preserve duplicates), read as dict-like ChannelRecords
+        self.optionalFeaturesTables=[] # list of lists, one entry per Optional Features table [name,rows]
+                                       #  (rows is a list of lists of th/td cell strings)
+        self.optionalFeaturesTableNames=set()
         if self.extension=='.htm':
+            cacheKey=None
+            cached=None
+            if cache:
+                with runReport.phase('cacheLoad',fileName):
+                    cacheKey=cache.key(fileName)
+                    cached=cache.load(cacheKey)
+            if cached:
+                logging.info('Loaded parse results for '+fileName+' from cache.')
+                [self.heading,channelTableState,self.optionalFeaturesTables]=cached
+                self.allChannelDicts.__setstate__(channelTableState)
+            else:
+                if parser=='auto':
+                    parser='stream' if os.path.getsize(fileName)>STREAMING_THRESHOLD_BYTES else 'soup'
+                logging.info('Parsing '+fileName+' ('+parser+' parser)...')
+                if parser=='stream':
+                    self.parseStream(fileName)
+                else:
+                    self.parseSoup(fileName)
+                self.allChannelDicts.compact()
+                logging.info('Parsing complete.')
+                if cache:
+                    with runReport.phase('cacheStore',fileName):
+                        cache.store(cacheKey,[self.heading,self.allChannelDicts.__getstate__(),self.optionalFeaturesTables])
+            logging.info('Imported '+str(len(self.allChannelDicts))+' channel entries and '+str(len(self.optionalFeaturesTables))+' Optional Features tables.')
+
+    def parseSoup(self,fileName):
+        with runReport.phase('parse',fileName):
             with open(fileName,'r') as html_doc:
-                logging.info('Parsing '+fileName+'...')
                 from bs4 import BeautifulSoup
                 self.soup=BeautifulSoup(html_doc,'html.parser')
-                logging.info('Parsing complete.')
-                for i in [x for x in self.soup.body.children if x.name]:
-                    # logging.info('i:'+str(i.name)+':'+str(i.string))
-                    # the first channel of each zone will have two h1 Channel Edit lines
-                    if i.name=='h1' and i.string=='Channel Edit' and i.find_next().name!='h1':
-                        # logging.info('Channel Edit heading found')
-                        # logging.info('  next:'+str(i.find_next().name))
-                        # logging.info('  next element:'+str(i.next_element.name))
-                        # logging.info('  next sibling:'+str(i.next_sibling.name))
-                        channelDict={}
-                        # logging.info('New Channel Edit header')
-                        t1=i.find_next('table') # next table should be 'Channel Edit' table
-                        t2=t1.find_next('table') # next table should be 'General' table
-                        t3=t2.find_next('table') # next table should be 'Analog' table
-                        for t in [t1,t2,t3]:
-                            # logging.info(' next table:')
-                            for tr in t.find_all('tr'):
-                                tds=tr.find_all('td')
-                                if len(tds)==2: # skip the first tr which only has th (heading) tags
-                                    [keyTd,valTd]=tds
-                                    key=keyTd.string
-                                    val=valTd.string
-                                    # logging.info('  '+key+' = '+val)
-                                    channelDict[key]=val
-                        self.allChannelDicts.append(channelDict)
-                    # after the channel data, we will be comparing all tables verbatim beginning with Optional Features
-                    #  (we don't want to blindly compare all tables above that, since the number of tables may vary)
-                    if i.name=='h1' and i.string=='Optional Features':
-                        while(i):
-                            i=i.find_next_sibling()
-                            if i and hasattr(i,'name'):
-                                # logging.info('next sibling:'+str(i.name)+':'+str(i.string))
-                                if i.name=='h1':
-                                    mostRecentHeader=i.string
-                                elif i.name=='table':
-                                    # store the table, with a unique table name
-                                    existingTableNames=[x[0] for x in self.optionalFeaturesTables]
-                                    tableName=mostRecentHeader
-                                    tableNum=2
-                                    while tableName in existingTableNames:
-                                        tableName=mostRecentHeader+':Table '+str(tableNum)
-                                        tableNum+=1
-                                    # logging.info('adding entry for table named '+tableName)
-                                    self.optionalFeaturesTables.append([tableName,i])
-                            else:
-                                i=False # end of file; stop iterating
-                logging.info('Imported '+str(len(self.allChannelDicts))+' channel entries and '+str(len(self.optionalFeaturesTables))+' Optional Features tables.')
+        with runReport.phase('extract',fileName):
+            self.extractSoup()
+        self.soup=None # the tree takes many times the size of the file; everything needed has been extracted
+
+    def extractSoup(self):
+        self.heading=cellString(self.soup.body.h1)
+        for i in [x for x in self.soup.body.children if x.name]:
+            # logging.info('i:'+str(i.name)+':'+str(i.string))
+            # the first channel of each zone will have two h1 Channel Edit lines
+            if i.name=='h1' and i.string=='Channel Edit' and i.find_next().name!='h1':
+                # logging.info('Channel Edit heading found')
+                # logging.info('  next:'+str(i.find_next().name))
+                # logging.info('  next element:'+str(i.next_element.name))
+                # logging.info('  next sibling:'+str(i.next_sibling.name))
+                channelDict={}
+                # logging.info('New Channel Edit header')
+                t1=i.find_next('table') # next table should be 'Channel Edit' table
+                t2=t1.find_next('table') # next table should be 'General' table
+                t3=t2.find_next('table') # next table should be 'Analog' table
+                for t in [t1,t2,t3]:
+                    # logging.info(' next table:')
+                    for tr in t.find_all('tr'):
+                        tds=tr.find_all('td')
+                        if len(tds)==2: # skip the first tr which only has th (heading) tags
+                            [keyTd,valTd]=tds
+                            key=cellString(keyTd)
+                            val=cellString(valTd)
+                            # logging.info('  '+key+' = '+val)
+                            channelDict[sys.intern(key)]=val
+                self.allChannelDicts.append(channelDict)
+            # after the channel data, we will be comparing all tables verbatim beginning with Optional Features
+            #  (we don't want to blindly compare all tables above that, since the number of tables may vary)
+            if i.name=='h1' and i.string=='Optional Features':
+                mostRecentHeader=str(i.string)
+                while(i):
+                    i=i.find_next_sibling()
+                    if i and hasattr(i,'name'):
+                        # logging.info('next sibling:'+str(i.name)+':'+str(i.string))
+                        if i.name=='h1':
+                            mostRecentHeader=cellString(i)
+                        elif i.name=='table':
+                            rows=[[cellString(item) for item in tr.find_all(['th','td'])] for tr in i.find_all('tr')]
+                            self.addOptionalFeaturesTable(mostRecentHeader,rows)
+                    else:
+                        i=False # end of file; stop iterating
+
+    # (parsing and extraction happen together, so this is all one 'parse' phase)
+    def parseStream(self,fileName):
+        with runReport.phase('parse',fileName):
+            streamParser=KPGStreamParser(self)
+            with open(fileName,'r') as html_doc:
+                while True:
+                    chunk=html_doc.read(STREAM_CHUNK_CHARS)
+                    if not chunk:
+                        break
+                    streamParser.feed(chunk)
+            streamParser.close()
+
+    def addOptionalFeaturesTable(self,header,rows):
+        # store the table, with a unique table name
+        tableName=header
+        tableNum=2
+        while tableName in self.optionalFeaturesTableNames:
+            tableName=header+':Table '+str(tableNum)
+            tableNum+=1
+        # logging.info('adding entry for table named '+tableName)
+        self.optionalFeaturesTableNames.add(tableName)
+        self.optionalFeaturesTables.append([tableName,rows])
 
     def getAllChannelDicts(self):
         return self.allChannelDicts
@@ -86,292 +291,2405 @@ class KWFile():
         return self.optionalFeaturesTables
 
 
-def getSynonyms(name,synonymsList):
-    found=False
-    rval=[name] # default return value: no synonyms, a.k.a. the name itself is the only item in the synonym set
-    for l in synonymsList:
-        if isinstance(l,list) and name in l:
-            if found:
+TX_KEY='Transmit Frequency [MHz]'
+RX_KEY='Receive Frequency [MHz]'
+ENC_KEY='QT/DQT Encode'
+DEC_KEY='QT/DQT Decode'
+
+# frequency string in MHz (e.g. '155.16000') to integer Hz, or None if it is not a frequency
+def frequencyHz(s):
+    if s is None:
+        return None
+    [mhz,dot,frac]=s.strip().partition('.')
+    if not mhz.isdigit() or (frac and not frac.isdigit()):
+        return None
+    return int(mhz)*1000000+int((frac+'000000')[:6])
+
+# Enc/Dec tone codes, shared by every ChannelTable in the process, so that the codes of records from
+#  different tables (two compared files, or the old and new versions of a watched file) can be compared
+#  directly; toneNames[code] is the tone string as it appears in the export
+toneNames=['None']
+toneCodes={'None':0}
+
+def toneCode(tone):
+    code=toneCodes.get(tone)
+    if code is None:
+        code=len(toneNames)
+        toneNames.append(sys.intern(tone) if isinstance(tone,str) else tone)
+        toneCodes[toneNames[code]]=code
+    return code
+
+# wider unsigned array type for each array type, for appendCode
+WIDER_CODES={'B':'H','H':'I','I':'Q'}
+
+# append code to an array of unsigned codes, widening the array when code doesn't fit its item size;
+#  returns the array (a new one if it was widened)
+def appendCode(codes,code):
+    try:
+        codes.append(code)
+    except OverflowError:
+        codes=array(WIDER_CODES[codes.typecode],codes)
+        codes.append(code)
+    return codes
+
+# Column-oriented store of the channel entries of one exported file.  Each field is a column of small
+#  integer codes (array('B'), widened to 'H' or 'I' as needed) into that field's list of distinct
+#  values, so a repeated value (zone names, tones, spacing, power, ...) costs a byte or two per channel
+#  rather than a pointer, and field names are stored once per table.  TX/RX frequencies are also kept
+#  as integer Hz (array('q')), and Enc/Dec tones as (process-wide) codes from toneCode (array('H')), so
+#  that the checks can group and compare channels without building or comparing strings.  Channels are
+#  read through ChannelRecord views, which are created on demand.
+#  - memory: about 57 bytes per channel after compact, versus about 840 bytes for a dict per channel holding
+#     the same interned strings (10k channels with 22 fields from kpgGen, not counting the strings themselves)
+class ChannelTable():
+    NO_TONE=0 # tone code of 'None'
+    NO_HZ=-1 # txHz/rxHz array entry for a missing or unparseable frequency
+    MISSING=False # value of fields that the channel entry doesn't have (values are otherwise str or None)
+    MISSING_CODE=0 # code of MISSING in every column
+
+    def __init__(self):
+        self.fieldNames=[]
+        self.fieldIndex={}
+        self.columns=[] # per field: array of one value code per channel
+        self.fieldValues=[] # per field: list of its distinct values, indexed by code; [0] is MISSING
+        self.valueCodes=[] # per field: dict of value: code, for append; None when dropped by compact
+        self.count=0
+        self.txHz=array('q')
+        self.rxHz=array('q')
+        self.encTones=array('H')
+        self.decTones=array('H')
+
+    def addField(self,name):
+        i=len(self.fieldNames)
+        self.fieldNames.append(sys.intern(name))
+        self.fieldIndex[self.fieldNames[i]]=i
+        self.columns.append(array('B',bytes(self.count)))
+        self.fieldValues.append([ChannelTable.MISSING])
+        self.valueCodes.append({})
+        return i
+
+    # drop the value lookups used by append, once all the channels have been added; for fields with
+    #  mostly distinct values (channel names, frequencies) they take more memory than the columns
+    def compact(self):
+        self.valueCodes=None
+
+    def append(self,channelDict):
+        if self.valueCodes is None:
+            self.valueCodes=[{values[code]:code for code in range(1,len(values))} for values in self.fieldValues]
+        codes=[ChannelTable.MISSING_CODE]*len(self.fieldNames)
+        for [key,val] in channelDict.items():
+            i=self.fieldIndex.get(key)
+            if i is None:
+                i=self.addField(key)
+                codes.append(ChannelTable.MISSING_CODE)
+            code=self.valueCodes[i].get(val)
+            if code is None:
+                code=len(self.fieldValues[i])
+                self.fieldValues[i].append(sys.intern(val) if val is not None else None)
+                self.valueCodes[i][val]=code
+            codes[i]=code
+        for i in range(len(codes)):
+            self.columns[i]=appendCode(self.columns[i],codes[i])
+        self.count+=1
+        n=self.count-1
+        for [hzArray,key] in [[self.txHz,TX_KEY],[self.rxHz,RX_KEY]]:
+            hz=frequencyHz(self.value(n,key))
+            hzArray.append(ChannelTable.NO_HZ if hz is None else hz)
+        self.encTones=appendCode(self.encTones,toneCode(self.value(n,ENC_KEY,None)))
+        self.decTones=appendCode(self.decTones,toneCode(self.value(n,DEC_KEY,None)))
+
+    # value of the named field of channel n, or default if the channel doesn't have the field
+    def value(self,n,key,default=None):
+        i=self.fieldIndex.get(key)
+        if i is None:
+            return default
+        code=self.columns[i][n]
+        return self.fieldValues[i][code] if code!=ChannelTable.MISSING_CODE else default
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return map(ChannelRecord,itertools.repeat(self,self.count),range(self.count))
+
+    def __getitem__(self,n):
+        if n<0:
+            n+=self.count
+        if not 0<=n<self.count:
+            raise IndexError('channel index out of range')
+        return ChannelRecord(self,n)
+
+    # state is the field list plus each field's distinct values and code column, as plain python and
+    #  array types; ParseCache stores this rather than the objects themselves, so that entries don't
+    #  depend on the module name.  The frequency and tone arrays are rebuilt from the values.
+    def __getstate__(self):
+        return [self.count,self.fieldNames,self.fieldValues,self.columns]
+
+    def __setstate__(self,state):
+        self.__init__()
+        [self.count,fieldNames,fieldValues,self.columns]=state
+        for i in range(len(fieldNames)):
+            self.fieldIndex[sys.intern(fieldNames[i])]=i
+            self.fieldNames.append(sys.intern(fieldNames[i]))
+            self.fieldValues.append([sys.intern(v) if isinstance(v,str) else v for v in fieldValues[i]])
+        self.compact()
+        # convert each distinct value once, then map the codes
+        for [hzArray,key] in [[self.txHz,TX_KEY],[self.rxHz,RX_KEY]]:
+            i=self.fieldIndex.get(key)
+            if i is None:
+                hzArray.extend([ChannelTable.NO_HZ]*self.count)
+            else:
+                hzValues=[ChannelTable.NO_HZ if hz is None else hz for hz in [frequencyHz(v) if isinstance(v,str) else None for v in self.fieldValues[i]]]
+                hzArray.extend([hzValues[code] for code in self.columns[i]])
+        for [attr,key] in [['encTones',ENC_KEY],['decTones',DEC_KEY]]:
+            i=self.fieldIndex.get(key)
+            if i is None:
+                codes=[ChannelTable.NO_TONE]*self.count
+            else:
+                toneValues=[toneCode(v if v is not ChannelTable.MISSING else None) for v in self.fieldValues[i]]
+                codes=[toneValues[code] for code in self.columns[i]]
+            setattr(self,attr,array('H' if max(codes,default=0)<=0xffff else 'I',codes))
+
+
+# view of one channel entry in a ChannelTable; read-only dict-like access by field name, as with the
+#  dictionaries previously returned by getAllChannelDicts, plus native typed attributes
+#  - views are created on demand, so two views of the same entry are different objects; use key
+#     (rather than id()) to recognize an entry
+class ChannelRecord(Mapping):
+    __slots__=('table','index')
+
+    def __init__(self,table,index):
+        self.table=table
+        self.index=index
+
+    @property
+    def key(self):
+        return (id(self.table),self.index)
+
+    @property
+    def zoneName(self):
+        return self.table.value(self.index,'Zone Name')
+
+    @property
+    def channelName(self):
+        return self.table.value(self.index,'Channel Name')
+
+    @property
+    def txHz(self):
+        hz=self.table.txHz[self.index]
+        return None if hz==ChannelTable.NO_HZ else hz
+
+    @property
+    def rxHz(self):
+        hz=self.table.rxHz[self.index]
+        return None if hz==ChannelTable.NO_HZ else hz
+
+    @property
+    def encTone(self):
+        return self.table.encTones[self.index]
+
+    @property
+    def decTone(self):
+        return self.table.decTones[self.index]
+
+    def __getitem__(self,key):
+        table=self.table
+        i=table.fieldIndex.get(key)
+        code=table.columns[i][self.index] if i is not None else ChannelTable.MISSING_CODE
+        if code==ChannelTable.MISSING_CODE:
+            raise KeyError(key)
+        return table.fieldValues[i][code]
+
+    def __iter__(self):
+        table=self.table
+        for i in range(len(table.fieldNames)):
+            if table.columns[i][self.index]!=ChannelTable.MISSING_CODE:
+                yield table.fieldNames[i]
+
+    def __len__(self):
+        return len([c for c in self.table.columns if c[self.index]!=ChannelTable.MISSING_CODE])
+
+    def __repr__(self):
+        return 'ChannelRecord('+repr(dict(self))+')'
+
+    # value of the named field for comparison purposes: the native typed value for frequencies and tones,
+    #  otherwise the string
+    def native(self,key):
+        if key==TX_KEY and self.txHz is not None:
+            return self.txHz
+        if key==RX_KEY and self.rxHz is not None:
+            return self.rxHz
+        if key==ENC_KEY:
+            return self.encTone
+        if key==DEC_KEY:
+            return self.decTone
+        return self[key]
+
+    def isSimplex(self):
+        return self.table.txHz[self.index]==self.table.rxHz[self.index]
+
+
+# sha256 hash object of a file's content
+def fileSha256(fileName):
+    h=hashlib.sha256()
+    with open(fileName,'rb') as f:
+        while True:
+            chunk=f.read(1024*1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h
+
+DEFAULT_CACHE_DIR=os.path.join(os.path.expanduser('~'),'.kpgCheck','cache')
+DEFAULT_CACHE_MAX_BYTES=256*1024*1024
+
+# Content-addressed on-disk cache of KWFile parse results.  Entries are keyed by a hash of the
+#  file content plus PARSER_VERSION, so a renamed or re-copied export still hits the cache, and an
+#  edited export (or a new version of the parser) never does.  Each entry is a zlib-compressed
+#  pickle of [heading,ChannelTable state,optionalFeaturesTables].  When the total size of the cache
+#  exceeds maxBytes, the least recently used entries are removed.
+class ParseCache():
+    def __init__(self,cacheDir=DEFAULT_CACHE_DIR,maxBytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cacheDir=cacheDir
+        self.maxBytes=maxBytes
+
+    def key(self,fileName):
+        h=fileSha256(fileName)
+        h.update(('kpgCheck parser version '+PARSER_VERSION).encode())
+        return h.hexdigest()
+
+    def entryPath(self,key):
+        return os.path.join(self.cacheDir,key+'.pickle.z')
+
+    def load(self,key):
+        path=self.entryPath(key)
+        try:
+            with open(path,'rb') as f:
+                data=pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning('WARNING: ignoring unreadable parse cache entry '+path+': '+str(e))
+            self.remove(path)
+            return None
+        try:
+            os.utime(path) # mark as recently used, for eviction
+        except OSError:
+            pass
+        return data
+
+    def store(self,key,data):
+        path=self.entryPath(key)
+        try:
+            os.makedirs(self.cacheDir,exist_ok=True)
+            tmpPath=path+'.'+str(os.getpid())+'.tmp'
+            with open(tmpPath,'wb') as f:
+                f.write(zlib.compress(pickle.dumps(data,protocol=pickle.HIGHEST_PROTOCOL),1))
+            os.replace(tmpPath,path) # atomic, so that concurrent runs never see a partial entry
+        except OSError as e:
+            logging.warning('WARNING: could not write parse cache entry '+path+': '+str(e))
+            return
+        self.evict()
+
+    def entries(self):
+        # list of [mtime,size,path], oldest first
+        rval=[]
+        try:
+            names=os.listdir(self.cacheDir)
+        except FileNotFoundError:
+            return rval
+        for name in names:
+            if name.endswith('.pickle.z'):
+                path=os.path.join(self.cacheDir,name)
+                try:
+                    st=os.stat(path)
+                except OSError:
+                    continue
+                rval.append([st.st_mtime,st.st_size,path])
+        rval.sort()
+        return rval
+
+    def evict(self):
+        entries=self.entries()
+        total=sum([e[1] for e in entries])
+        for [mtime,size,path] in entries:
+            if total<=self.maxBytes:
+                break
+            self.remove(path)
+            total-=size
+
+    def clear(self):
+        entries=self.entries()
+        for e in entries:
+            self.remove(e[2])
+        return len(entries)
+
+    def remove(self,path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+SNAPSHOT_SCHEMA_VERSION='1'
+
+# Local SQLite database of normalized snapshots of exported files, so that questions about past codeplugs
+#  (which radios have a channel, every channel on a frequency, ...) can be answered across any number of
+#  stored exports without parsing html again.
+#  - each snapshot holds one export's channels (with typed, indexed frequency, tone and name columns, plus
+#     all of the channel's fields as JSON), its zones, and its Optional Features tables
+#  - a radio is identified by the base name of its export (without extension) unless another name is given;
+#     storing the same content for the same radio again just returns the existing snapshot
+#  - the queries only look at the latest snapshot of each radio (by export file time) unless latest is False
+class SnapshotStore():
+    def __init__(self,dbFileName):
+        import sqlite3
+        self.dbFileName=dbFileName
+        # batch workers write to the same database concurrently; wait for each other's transactions
+        self.db=sqlite3.connect(dbFileName,timeout=60)
+        self.db.row_factory=sqlite3.Row
+        self.db.execute('PRAGMA foreign_keys=ON')
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY,value TEXT);
+                CREATE TABLE IF NOT EXISTS snapshots(
+                    id INTEGER PRIMARY KEY,radio TEXT,fileName TEXT,contentHash TEXT,heading TEXT,
+                    fileTime REAL,storedTime TEXT,channelCount INTEGER,zoneCount INTEGER,tableCount INTEGER);
+                CREATE TABLE IF NOT EXISTS zones(
+                    snapshot INTEGER REFERENCES snapshots(id) ON DELETE CASCADE,
+                    zoneNumber INTEGER,zoneName TEXT,channelCount INTEGER,contentHash TEXT);
+                CREATE TABLE IF NOT EXISTS channels(
+                    snapshot INTEGER REFERENCES snapshots(id) ON DELETE CASCADE,
+                    position INTEGER,zoneNumber INTEGER,zoneName TEXT,channelNumber INTEGER,channelName TEXT,
+                    txHz INTEGER,rxHz INTEGER,encTone TEXT,decTone TEXT,fields TEXT);
+                CREATE TABLE IF NOT EXISTS optionalFeatures(
+                    snapshot INTEGER REFERENCES snapshots(id) ON DELETE CASCADE,
+                    tableName TEXT,rowNum INTEGER,cells TEXT);
+                CREATE INDEX IF NOT EXISTS snapshotsRadio ON snapshots(radio,contentHash);
+                CREATE INDEX IF NOT EXISTS zonesSnapshot ON zones(snapshot);
+                CREATE INDEX IF NOT EXISTS channelsSnapshot ON channels(snapshot);
+                CREATE INDEX IF NOT EXISTS channelsTx ON channels(txHz);
+                CREATE INDEX IF NOT EXISTS channelsRx ON channels(rxHz);
+                CREATE INDEX IF NOT EXISTS channelsEnc ON channels(encTone);
+                CREATE INDEX IF NOT EXISTS channelsDec ON channels(decTone);
+                CREATE INDEX IF NOT EXISTS channelsName ON channels(channelName COLLATE NOCASE);
+                CREATE INDEX IF NOT EXISTS optionalFeaturesSnapshot ON optionalFeatures(snapshot,tableName);
+            """)
+            row=self.db.execute("SELECT value FROM meta WHERE key='schemaVersion'").fetchone()
+            if row is None:
+                self.db.execute("INSERT INTO meta VALUES ('schemaVersion',?)",(SNAPSHOT_SCHEMA_VERSION,))
+            elif row[0]!=SNAPSHOT_SCHEMA_VERSION:
+                raise ValueError('snapshot database '+dbFileName+' has schema version '+row[0]+'; this version of kpgCheck uses '+SNAPSHOT_SCHEMA_VERSION)
+
+    def close(self):
+        self.db.close()
+
+    # store a snapshot of a parsed export; returns [snapshot id,True if it was added or False if it was already stored]
+    def add(self,kwFile,radio=None):
+        import json
+        fileName=kwFile.fileName
+        radio=radio or os.path.splitext(os.path.basename(fileName))[0]
+        contentHash=fileSha256(fileName).hexdigest()
+        with self.db:
+            row=self.db.execute('SELECT id FROM snapshots WHERE radio=? AND contentHash=?',(radio,contentHash)).fetchone()
+            if row:
+                return [row['id'],False]
+            records=kwFile.getAllChannelDicts()
+            zones=groupByZone(records)
+            tables=kwFile.getOptionalFeaturesTables()
+            cursor=self.db.execute('INSERT INTO snapshots(radio,fileName,contentHash,heading,fileTime,storedTime,channelCount,zoneCount,tableCount) VALUES (?,?,?,?,?,?,?,?,?)',
+                    (radio,fileName,contentHash,kwFile.heading,os.path.getmtime(fileName),time.strftime('%Y-%m-%d %H:%M:%S',time.localtime()),len(records),len(zones),len(tables)))
+            snapshotId=cursor.lastrowid
+            fields=[c[0] for c in colKey]
+            self.db.executemany('INSERT INTO zones VALUES (?,?,?,?,?)',
+                    [(snapshotId,intOrNone(zoneRecords[0].get('Zone Number')),zoneName,len(zoneRecords),channelsHash(zoneRecords,fields)) for [zoneName,zoneRecords] in zones.items()])
+            self.db.executemany('INSERT INTO channels VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                    [(snapshotId,n,intOrNone(d.get('Zone Number')),d.zoneName,intOrNone(d.get('Channel Number')),d.channelName,d.txHz,d.rxHz,d.get(ENC_KEY),d.get(DEC_KEY),json.dumps(dict(d)))
+                        for [n,d] in enumerate(records)])
+            self.db.executemany('INSERT INTO optionalFeatures VALUES (?,?,?,?)',
+                    [(snapshotId,tableName,n,json.dumps(rows[n])) for [tableName,rows] in tables for n in range(len(rows))])
+        return [snapshotId,True]
+
+    def latestCondition(self,alias='s'):
+        return ('NOT EXISTS (SELECT 1 FROM snapshots t WHERE t.radio='+alias+'.radio'
+            ' AND (t.fileTime>'+alias+'.fileTime OR (t.fileTime='+alias+'.fileTime AND t.id>'+alias+'.id)))')
+
+    # list of snapshot rows (dict-like sqlite3.Row), by radio
+    def snapshots(self,latest=True):
+        sql='SELECT * FROM snapshots s'
+        if latest:
+            sql+=' WHERE '+self.latestCondition()
+        return self.db.execute(sql+' ORDER BY radio,fileTime,id').fetchall()
+
+    # channels of the stored snapshots that match all of the given criteria, as dicts with the radio and
+    #  snapshot file name; fields is the dict of all of the channel's fields
+    #  - names: channel names (case-insensitive), e.g. a name and its legal synonyms
+    #  - lowHz,highHz: TX or RX frequency in this range (inclusive)
+    #  - tone: Enc or Dec tone
+    def findChannels(self,names=None,lowHz=None,highHz=None,tone=None,latest=True):
+        import json
+        conditions=[]
+        params=[]
+        if names:
+            conditions.append('c.channelName COLLATE NOCASE IN ('+','.join(['?']*len(names))+')')
+            params+=list(names)
+        if lowHz is not None:
+            conditions.append('(c.txHz BETWEEN ? AND ? OR c.rxHz BETWEEN ? AND ?)')
+            params+=[lowHz,highHz,lowHz,highHz]
+        if tone is not None:
+            conditions.append('(c.encTone=? OR c.decTone=?)')
+            params+=[tone,tone]
+        if latest:
+            conditions.append(self.latestCondition())
+        sql='SELECT s.radio,s.fileName,s.id AS snapshot,c.* FROM channels c JOIN snapshots s ON s.id=c.snapshot'
+        if conditions:
+            sql+=' WHERE '+' AND '.join(conditions)
+        rows=[]
+        for row in self.db.execute(sql+' ORDER BY s.radio,s.fileTime,s.id,c.position',params):
+            d=dict(row)
+            d['fields']=json.loads(d['fields'])
+            rows.append(d)
+        return rows
+
+    # sorted list of the radios that have a channel with one of the given names
+    def radiosWithChannel(self,names,latest=True):
+        return sorted(set([d['radio'] for d in self.findChannels(names=names,latest=latest)]))
+
+    # [tableName,rows] for each Optional Features table of a snapshot, in file order
+    def optionalFeaturesTables(self,snapshotId):
+        import json
+        tables=[]
+        for row in self.db.execute('SELECT tableName,cells FROM optionalFeatures WHERE snapshot=? ORDER BY rowid',(snapshotId,)):
+            if not tables or tables[-1][0]!=row['tableName']:
+                tables.append([row['tableName'],[]])
+            tables[-1][1].append(json.loads(row['cells']))
+        return tables
+
+def intOrNone(s):
+    try:
+        return int(s)
+    except (TypeError,ValueError):
+        return None
+
+# store a snapshot of a parsed export in the snapshot database dbFileName, and log the result
+def storeSnapshot(dbFileName,kwFile,radio=None):
+    store=SnapshotStore(dbFileName)
+    try:
+        [snapshotId,added]=store.add(kwFile,radio)
+    finally:
+        store.close()
+    if added:
+        logging.info('Stored snapshot '+str(snapshotId)+' of '+kwFile.fileName+' in '+dbFileName)
+    else:
+        logging.info(kwFile.fileName+' is already stored in '+dbFileName+' (snapshot '+str(snapshotId)+')')
+    return snapshotId
+
+
+# plain-str equivalent of a bs4 element's .string, so that extracted values don't keep the parse tree alive
+def cellString(element):
+    s=element.string
+    if s is None:
+        return None
+    return str(s)
+
+
+# elements that never have an end tag
+VOID_ELEMENTS={'area','base','br','col','embed','hr','img','input','link','meta','param','source','track','wbr'}
+
+# Event-driven extractor for KPG-D1N html files: recognizes the same structures as KWFile.parseSoup
+#  ('Channel Edit' h1 followed by the Channel Edit, General, and Analog tables; and each table after
+#  the 'Optional Features' h1) in one forward pass over the file.  Only the h1 or table row currently
+#  being read is held in memory, never the whole document.
+class KPGStreamParser(HTMLParser):
+    def __init__(self,kwFile):
+        super().__init__(convert_charrefs=True)
+        self.kwFile=kwFile
+        self.capture=None # list of open element nodes while reading an h1 or th/td; each node is a list of its children
+        self.captureTag=None
+        self.headingRead=False # the first h1 is the heading, even if it has no single string (heading None)
+        self.pendingChannelEdit=False # a 'Channel Edit' h1 was just read; a channel starts unless the next tag is also an h1
+        self.channelTablesRemaining=0 # tables left to read for the current channel (Channel Edit, General, Analog)
+        self.channelDict=None
+        self.inOptionalFeatures=False
+        self.mostRecentHeader=None
+        self.tableDepth=0
+        self.tableRows=None # rows of the current top-level table
+        self.row=None # [tag,string] cells of the current row
+
+    def handle_starttag(self,tag,attrs):
+        if self.pendingChannelEdit:
+            self.pendingChannelEdit=False
+            if tag!='h1':
+                self.channelDict={}
+                self.channelTablesRemaining=3
+        if self.capture is not None:
+            node=[]
+            self.capture[-1].append(node)
+            if tag not in VOID_ELEMENTS:
+                self.capture.append(node)
+            return
+        if tag=='table':
+            self.tableDepth+=1
+            if self.tableDepth==1:
+                self.tableRows=[]
+        elif self.tableDepth==0:
+            if tag=='h1':
+                self.startCapture(tag)
+        elif self.tableDepth==1:
+            if tag=='tr':
+                self.row=[]
+            elif tag in ('th','td') and self.row is not None:
+                self.startCapture(tag)
+
+    def handle_startendtag(self,tag,attrs):
+        if self.capture is not None:
+            self.capture[-1].append([])
+        else:
+            self.handle_starttag(tag,attrs)
+
+    def handle_endtag(self,tag):
+        if self.capture is not None:
+            if tag==self.captureTag and len(self.capture)==1:
+                s=nodeString(self.capture[0])
+                self.capture=None
+                self.endCapture(tag,s)
+            elif len(self.capture)>1 and tag not in VOID_ELEMENTS:
+                self.capture.pop()
+            return
+        if tag=='table' and self.tableDepth>0:
+            self.tableDepth-=1
+            if self.tableDepth==0:
+                self.endTable()
+        elif tag=='tr' and self.tableDepth==1 and self.row is not None:
+            self.tableRows.append(self.row)
+            self.row=None
+
+    def handle_data(self,data):
+        if self.capture is not None:
+            node=self.capture[-1]
+            if node and isinstance(node[-1],str): # text split across feed() chunks
+                node[-1]+=data
+            else:
+                node.append(data)
+
+    def startCapture(self,tag):
+        self.captureTag=tag
+        self.capture=[[]]
+
+    def endCapture(self,tag,s):
+        if tag=='h1':
+            if not self.headingRead:
+                self.headingRead=True
+                self.kwFile.heading=s
+            if s=='Channel Edit':
+                self.pendingChannelEdit=True
+            if self.inOptionalFeatures:
+                self.mostRecentHeader=s
+            elif s=='Optional Features':
+                self.inOptionalFeatures=True
+                self.mostRecentHeader=s
+        else:
+            self.row.append([tag,s])
+
+    def endTable(self):
+        rows=self.tableRows
+        self.tableRows=None
+        if self.channelTablesRemaining>0:
+            for row in rows:
+                tds=[s for [tag,s] in row if tag=='td']
+                if len(tds)==2: # skip the first tr which only has th (heading) tags
+                    [key,val]=tds
+                    self.channelDict[sys.intern(key)]=val
+            self.channelTablesRemaining-=1
+            if self.channelTablesRemaining==0:
+                self.kwFile.allChannelDicts.append(self.channelDict)
+                self.channelDict=None
+        if self.inOptionalFeatures:
+            self.kwFile.addOptionalFeaturesTable(self.mostRecentHeader,[[s for [tag,s] in row] for row in rows])
+
+
+# equivalent of bs4 .string for a node captured by KPGStreamParser: the text, if the node's only
+#  descendant along a single-child chain is text; otherwise None
+def nodeString(node):
+    while len(node)==1:
+        child=node[0]
+        if isinstance(child,str):
+            return child
+        node=child
+    return None
+
+
+# Legal channel name synonym sets, read from one or more synonym files (see synonyms.txt for the format).
+#  All files are parsed once, into a hash map from each case-folded name to the id of its set, so that
+#  synonym lookups don't depend on the number of sets.  A name that appears in more than one set is a
+#  conflict; conflicts are recorded (and logged) at load time, and the name stays in the first set.
+class SynonymIndex():
+    def __init__(self,fileNames=[]):
+        self.sets=[] # list of lists of names, as written in the file(s)
+        self.setSources=[] # [fileName,lineNum] for each set
+        self.setIds={} # case-folded name: index into self.sets
+        self.conflicts=[] # list of [name,setId of first set,setId of conflicting set]
+        for fileName in fileNames:
+            self.load(fileName)
+
+    # raises ValueError for a line that isn't a list of double-quoted names
+    def load(self,fileName):
+        with open(fileName,'r') as f:
+            for lineNum,line in enumerate(f,1):
+                line=line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                names=re.findall(r'"([^"]*)"',line)
+                if not names or re.sub(r'"[^"]*"','',line).strip():
+                    raise ValueError('Error during parse of '+fileName+' while reading line '+str(lineNum)+':\n  '+line)
+                self.addSet(names,[fileName,lineNum])
+
+    def addSet(self,names,source=None):
+        setId=len(self.sets)
+        self.sets.append(names)
+        self.setSources.append(source)
+        for name in names:
+            folded=name.casefold()
+            existingId=self.setIds.setdefault(folded,setId)
+            if existingId!=setId:
+                self.conflicts.append([name,existingId,setId])
                 logging.error('ERROR during synonym checking: '+name+' appears in more than one synonym set:')
-                logging.error('  '+str(rval))
-                logging.error('  '+str(l))
-            found=True
-            rval=l
-    return rval
+                for i in [existingId,setId]:
+                    logging.error('  '+str(self.sets[i])+self.sourceString(i))
+
+    def sourceString(self,setId):
+        source=self.setSources[setId]
+        if not source:
+            return ''
+        return '  ('+source[0]+' line '+str(source[1])+')'
+
+    def setId(self,name):
+        return self.setIds.get(name.casefold())
+
+    def areSynonyms(self,name1,name2):
+        if name1.casefold()==name2.casefold():
+            return True
+        setId=self.setId(name1)
+        return setId is not None and setId==self.setId(name2)
+
+    # the synonym set that includes name; just [name] if it has no synonyms
+    def getSynonyms(self,name):
+        setId=self.setId(name)
+        if setId is None:
+            return [name]
+        return self.sets[setId]
+
+    def __len__(self):
+        return len(self.sets)
+
+# Internal consistency rule engine
+#  - each rule is a ConsistencyRule subclass, registered (in report order) with @registerRule
+#  - a rule either checks groups of channels that share a grouping key (set 'grouping' to the name of
+#     a grouping registered with registerGrouping, and implement checkGroup), or checks channels one at a
+#     time (leave grouping as None, and implement checkRecord)
+#  - ChannelIndexes builds every grouping needed by the active rules in a single pass over the channels,
+#     and the rules share them read-only, so rules can run in parallel threads
+#  - rules return Finding objects; formatFinding renders a finding as lines of the text report
+#  - teams can add their own rules in a separate .py file loaded with --rules; see README.md
+
+groupings={} # grouping name: function returning the grouping key of a ChannelRecord
+rules=[] # registered rule instances, in report order
+
+def registerGrouping(name,keyFunction):
+    groupings[name]=keyFunction
+
+def registerRule(ruleClass):
+    rules.append(ruleClass())
+    return ruleClass
+
+registerGrouping('channelName',lambda d: d.channelName)
+registerGrouping('txRxEnc',lambda d: (d.txHz,d.rxHz,d.encTone))
+
+# one problem found with one channel (records[recordIndex] of a Finding); refValue is the value of the
+#  group's first channel, or for rules without a grouping, the expected value
+class Issue():
+    __slots__=('recordIndex','field','value','refValue','severity')
+
+    def __init__(self,recordIndex,field,value,refValue,severity='discrepancy'):
+        self.recordIndex=recordIndex
+        self.field=field
+        self.value=value
+        self.refValue=refValue
+        self.severity=severity # 'discrepancy', or 'note' for differences that are allowed (such as synonyms)
+
+# one result of a rule: a group of channels that share a grouping key (or a single channel, for
+#  rules without a grouping), with any issues found among them
+class Finding():
+    __slots__=('rule','key','records','issues')
+
+    def __init__(self,rule,key,records,issues=None):
+        self.rule=rule
+        self.key=key
+        self.records=records
+        self.issues=issues or []
+
+    def discrepancyCount(self):
+        return len([i for i in self.issues if i.severity=='discrepancy'])
+
+    def recordIssues(self,recordIndex):
+        return [i for i in self.issues if i.recordIndex==recordIndex]
+
+# all groupings needed by a set of rules, built in one pass over the channel records
+#  (plus the sorted frequency index, if any of the rules uses it)
+class ChannelIndexes():
+    def __init__(self,records,ruleList):
+        self.records=list(records) # ChannelTable creates its views on demand; create them once, for all the rules
+        records=self.records
+        names=[]
+        for rule in ruleList:
+            if rule.grouping and rule.grouping not in names:
+                names.append(rule.grouping)
+        self.groups={name:{} for name in names} # grouping name: {key: list of records}
+        keyFunctions=[[groupings[name],self.groups[name]] for name in names]
+        for d in records:
+            for [keyFunction,groups] in keyFunctions:
+                groups.setdefault(keyFunction(d),[]).append(d)
+        self.frequencyIndex=None
+        if [rule for rule in ruleList if rule.usesFrequencyIndex]:
+            self.frequencyIndex=FrequencyIndex(channelFrequencies(records))
+
+# sorted index of distinct frequencies, for range queries in O(log n) and proximity searches in O(n log n)
+#  rather than comparing every pair of channels
+#  - items is a sequence of [frequency in Hz,item]; each frequency keeps the list of its items
+class FrequencyIndex():
+    def __init__(self,items=()):
+        self.items={} # frequency in Hz: list of items
+        for [hz,item] in items:
+            self.items.setdefault(hz,[]).append(item)
+        self.frequencies=sorted(self.items.keys())
+
+    # the distinct frequencies from lowHz to highHz (inclusive), in order
+    def frequenciesBetween(self,lowHz,highHz):
+        return self.frequencies[bisect.bisect_left(self.frequencies,lowHz):bisect.bisect_right(self.frequencies,highHz)]
+
+    # [hz1,hz2] for each pair of distinct frequencies that are no more than maxHz apart, in order
+    def pairsWithin(self,maxHz):
+        pairs=[]
+        frequencies=self.frequencies
+        for i in range(len(frequencies)):
+            end=bisect.bisect_right(frequencies,frequencies[i]+maxHz,i+1)
+            for j in range(i+1,end):
+                pairs.append([frequencies[i],frequencies[j]])
+        return pairs
+
+# [frequency in Hz,channel record] for each distinct TX and RX frequency of each channel
+def channelFrequencies(records):
+    for d in records:
+        if d.txHz:
+            yield [d.txHz,d]
+        if d.rxHz and d.rxHz!=d.txHz:
+            yield [d.rxHz,d]
+
+def mhzString(hz):
+    return '%.5f' % (hz/1000000)
+
+class ConsistencyRule():
+    grouping=None # name of a registered grouping, or None to check each channel individually
+    usesFrequencyIndex=False # True if check() uses indexes.frequencyIndex
+    description=[] # report heading: first line describes the check; any other lines give detail
+
+    def check(self,indexes,context):
+        findings=[]
+        if self.grouping:
+            for [key,records] in indexes.groups[self.grouping].items():
+                finding=self.checkGroup(key,records,context)
+                if finding:
+                    findings.append(finding)
+        else:
+            for d in indexes.records:
+                finding=self.checkRecord(d,context)
+                if finding:
+                    findings.append(finding)
+        return findings
+
+    # return a Finding for this group, or None
+    def checkGroup(self,key,records,context):
+        return None
+
+    # return a Finding for this channel, or None
+    def checkRecord(self,d,context):
+        return None
+
+    # lines of the text report for a finding; the default lists the channels, each followed by its issues
+    def formatFinding(self,finding):
+        if not self.grouping:
+            lines=[channelString(finding.records[0],True)+':']
+            for issue in finding.issues:
+                lines.append('    *** DISCREPANCY: '+issue.field+' = '+str(issue.value)+' (expected '+str(issue.refValue)+')')
+            return lines
+        lines=[str(finding.key)+':']
+        for i in range(len(finding.records)):
+            lines.append('  '+channelString(finding.records[i],True))
+            for issue in finding.recordIssues(i):
+                lines.append(issueString(issue,finding.records[0]))
+        return lines
+
+# default maximum difference between two distinct frequencies for them to be reported as too close:
+#  anything closer than the narrowest channel spacing is a near-duplicate (usually a typo)
+DEFAULT_PROXIMITY_HZ=6250
+
+# standard repeater offsets: [low Hz,high Hz,list of offsets in Hz] for each band that has them
+#  (channels outside these bands are not checked, since e.g. VHF high band has no standard offset)
+DEFAULT_REPEATER_OFFSETS=[
+     [144000000,148000000,[600000]]
+    ,[222000000,225000000,[1600000]]
+    ,[420000000,470000000,[5000000]]
+    ,[470000000,512000000,[3000000]]
+    ,[806000000,869000000,[45000000]]
+    ,[896000000,940000000,[39000000]]
+]
+
+# information available to rules, other than the channels themselves
+class CheckContext():
+    def __init__(self,synonymIndex=None,proximityHz=DEFAULT_PROXIMITY_HZ,repeaterOffsets=None):
+        self.synonymIndex=synonymIndex or SynonymIndex()
+        self.proximityHz=proximityHz
+        self.repeaterOffsets=DEFAULT_REPEATER_OFFSETS if repeaterOffsets is None else repeaterOffsets
+
+    # list of standard offsets (Hz) for a repeater channel, or None if its band has none
+    def standardOffsets(self,txHz,rxHz):
+        for hz in [rxHz,txHz]:
+            for [lowHz,highHz,offsets] in self.repeaterOffsets:
+                if lowHz<=hz<=highHz:
+                    return offsets
+        return None
+
+# parse a --repeater-offset argument: 'LOW-HIGH:OFFSET[,OFFSET...]' in MHz; raises ValueError if it is malformed
+def parseRepeaterOffset(s):
+    [band,colon,offsets]=s.partition(':')
+    [low,dash,high]=band.partition('-')
+    hzValues=[frequencyHz(v) for v in [low,high]+offsets.split(',')]
+    if not colon or not dash or None in hzValues:
+        raise ValueError('repeater offset must be LOW-HIGH:OFFSET[,OFFSET...] in MHz, e.g. 450-470:5: '+s)
+    return [hzValues[0],hzValues[1],hzValues[2:]]
+
+def channelString(d,withName=False):
+    s='Zone '+str(d['Zone Number'])+' ('+d['Zone Name']+')  Channel '+str(d['Channel Number'])
+    if withName:
+        s+=' ('+d['Channel Name']+')'
+    return s
+
+def issueString(issue,d0):
+    return '    *** DISCREPANCY: '+issue.field+': '+str(issue.value)+' is different than '+str(issue.refValue)+' in '+channelString(d0)
+
+# run each rule over the shared indexes; returns a list of findings per rule, in rule order
+def runRules(ruleList,indexes,context,threads=1,fileName=None):
+    def runRule(rule):
+        with runReport.phase('check:'+rule.__class__.__name__,fileName):
+            return rule.check(indexes,context)
+    if threads>1 and len(ruleList)>1 and not runReport.sequentialPhases():
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(runRule,ruleList))
+    return [runRule(rule) for rule in ruleList]
+
+loadedRuleFiles=set()
+
+# load team-specific rules from a python file, which registers them with @registerRule
+def loadRuleFile(fileName):
+    path=os.path.abspath(fileName)
+    if path in loadedRuleFiles:
+        return
+    loadedRuleFiles.add(path)
+    import importlib.util
+    # rule files do 'from kpgCheck import ...'; make sure that refers to this module even when it is run as a script
+    sys.modules.setdefault('kpgCheck',sys.modules[__name__])
+    spec=importlib.util.spec_from_file_location('kpgRules_'+os.path.splitext(os.path.basename(path))[0],path)
+    module=importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+@registerRule
+class SameNameRule(ConsistencyRule):
+    grouping='channelName'
+    description=[
+        'Report all channel names that appear more than once in the html file, and show any discrepancies:'
+        ,' - channels with the same name should have identical TX/RX/Enc/Dec/Spacing/PTT ID']
+    keysToCompare=[
+        'Transmit Frequency [MHz]'
+        ,'Receive Frequency [MHz]'
+        ,'QT/DQT Encode'
+        ,'QT/DQT Decode'
+        ,'Channel Spacing (Analog) [kHz]'
+        ,'PTT ID (Analog)']
+
+    def checkGroup(self,key,records,context):
+        if len(records)<2:
+            return None
+        d0=records[0]
+        issues=[]
+        for i in range(1,len(records)):
+            d=records[i]
+            for key in self.keysToCompare:
+                if d.native(key)!=d0.native(key):
+                    issues.append(Issue(i,key,d[key],d0[key]))
+        return Finding(self,d0.channelName,records,issues)
+
+    def formatFinding(self,finding):
+        lines=['Channel "'+finding.key+'" appears in multiple entries:']
+        for i in range(len(finding.records)):
+            lines.append('  '+channelString(finding.records[i]))
+            for issue in finding.recordIssues(i):
+                lines.append(issueString(issue,finding.records[0]))
+        return lines
+
+# check channels that have all the same TX/RX/Enc but different name (since same-name is handled in SameNameRule)
+@registerRule
+class SameTxRxEncRule(ConsistencyRule):
+    grouping='txRxEnc'
+    description=[
+        'Report all TX/RX/Enc sets that appear more than once in the html file, and show any discrepancies:'
+        ,' - channels with the same TX/RX/Enc values should have identical name (or synonym)/Dec/Spacing/PTT ID']
+    keysToCompare=[
+        'Channel Name'
+        ,'Channel Spacing (Analog) [kHz]'
+        ,'PTT ID (Analog)']
+    simplexAdditionalKeysToCompare=[
+        'QT/DQT Decode'
+    ]
+
+    def checkGroup(self,key,records,context):
+        if len(records)<2:
+            return None
+        d0=records[0]
+        issues=[]
+        for i in range(1,len(records)):
+            d=records[i]
+            if d.isSimplex():
+                keyList=self.keysToCompare+self.simplexAdditionalKeysToCompare
+            else:
+                keyList=self.keysToCompare
+            for key in keyList:
+                if str(d[key]).lower()!=str(d0[key]).lower():
+                    if key=='Channel Name' and context.synonymIndex.areSynonyms(d[key],d0[key]):
+                        issues.append(Issue(i,key,d[key],d0[key],'note'))
+                    else:
+                        issues.append(Issue(i,key,d[key],d0[key]))
+        return Finding(self,str(d0[TX_KEY])+':'+str(d0[RX_KEY])+':'+str(d0[ENC_KEY]),records,issues)
+
+    def formatFinding(self,finding):
+        d0=finding.records[0]
+        lines=['TX/RX/Enc set '+finding.key+' appears in multiple entries:']
+        for i in range(len(finding.records)):
+            lines.append('  '+channelString(finding.records[i],True))
+            for issue in finding.recordIssues(i):
+                if issue.severity=='note':
+                    lines.append('    ** Channel name '+issue.value+' is different than '+issue.refValue+' in '+channelString(d0)+' but they are legal synonyms')
+                else:
+                    lines.append(issueString(issue,d0))
+        return lines
+
+# all simplex channels should have dec=None or dec=enc
+@registerRule
+class SimplexToneRule(ConsistencyRule):
+    description=['All simplex channels should have dec=None or dec=enc']
+
+    def checkRecord(self,d,context):
+        if d.isSimplex() and d.decTone!=ChannelTable.NO_TONE and d.decTone!=d.encTone:
+            return Finding(self,None,[d],[Issue(0,'Dec',d[DEC_KEY],d[ENC_KEY])])
+        return None
+
+    def formatFinding(self,finding):
+        d=finding.records[0]
+        return [
+            'Simplex channel enc/dec check:'
+            ,'  '+channelString(d,True)
+            ,'    *** DISCREPANCY: Enc = '+str(d[ENC_KEY])+'  Dec = '+str(d[DEC_KEY])]
+
+# channels that use distinct frequencies within context.proximityHz of each other: adjacent-channel and
+#  near-duplicate entries (channels on exactly the same frequency are handled by the other rules)
+@registerRule
+class FrequencyProximityRule(ConsistencyRule):
+    usesFrequencyIndex=True
+    description=[
+        'Report frequencies that are close to another frequency used in the html file, without being equal:'
+        ,' - distinct TX/RX frequencies within the proximity offset (--proximity) are adjacent-channel or near-duplicate entries']
+
+    def check(self,indexes,context):
+        findings=[]
+        frequencyIndex=indexes.frequencyIndex
+        for [hz1,hz2] in frequencyIndex.pairsWithin(context.proximityHz):
+            records=[]
+            keys=set()
+            for d in frequencyIndex.items[hz1]+frequencyIndex.items[hz2]:
+                if d.key not in keys:
+                    keys.add(d.key)
+                    records.append(d)
+            n=min(len(frequencyIndex.items[hz1]),len(records)-1)
+            findings.append(Finding(self,(hz1,hz2),records,[Issue(n,'Frequency',mhzString(hz2),mhzString(hz1))]))
+        return findings
+
+    def formatFinding(self,finding):
+        [hz1,hz2]=finding.key
+        lines=['Frequencies '+mhzString(hz1)+' and '+mhzString(hz2)+' are '+('%.3f' % ((hz2-hz1)/1000))+' kHz apart:']
+        for d in finding.records:
+            uses=[label+' '+mhzString(hz) for [label,hz] in [['TX',d.txHz],['RX',d.rxHz]] if hz in (hz1,hz2)]
+            lines.append('  '+channelString(d,True)+'  '+'  '.join(uses))
+        lines.append('    *** DISCREPANCY: '+finding.issues[0].value+' is '+('%.3f' % ((hz2-hz1)/1000))+' kHz from '+finding.issues[0].refValue)
+        return lines
+
+# repeater (duplex) channels should use the standard offset of their band
+@registerRule
+class RepeaterOffsetRule(ConsistencyRule):
+    description=[
+        'All repeater channels should use a standard TX/RX offset for their band:'
+        ,' - see --repeater-offset; channels in bands without a standard offset are not checked']
+
+    def checkRecord(self,d,context):
+        if not d.txHz or not d.rxHz or d.isSimplex():
+            return None
+        offsets=context.standardOffsets(d.txHz,d.rxHz)
+        if offsets is None or abs(d.txHz-d.rxHz) in offsets:
+            return None
+        return Finding(self,None,[d],[Issue(0,'Offset',mhzString(abs(d.txHz-d.rxHz)),' or '.join([mhzString(hz) for hz in offsets]))])
+
+    def formatFinding(self,finding):
+        d=finding.records[0]
+        issue=finding.issues[0]
+        return [
+            'Repeater offset check:'
+            ,'  '+channelString(d,True)
+            ,'    *** DISCREPANCY: TX = '+str(d[TX_KEY])+'  RX = '+str(d[RX_KEY])+'  offset = '+issue.value+' MHz (standard: '+issue.refValue+' MHz)']
+
+colKey=[
+     ['Zone Number','Zone#']
+    ,['Zone Name','Zone Name']
+    ,['Channel Number','Chan#']
+    ,['Channel Name','Channel Name']
+    ,['Transmit Frequency [MHz]','TX']
+    ,['Receive Frequency [MHz]','RX']
+    ,['QT/DQT Encode','Enc']
+    ,['QT/DQT Decode','Dec']
+    ,['Channel Spacing (Analog) [kHz]','Spacing']
+    ,['PTT ID (Analog)','PTT ID']
+    ,['Scan Add','Scan Add']
+]
+
+def getOutputFileNames(srcFileName):
+    srcBaseName=os.path.splitext(srcFileName)[0]
+    return [srcBaseName+'.csv',srcBaseName+'.otherTables.csv']
+
+def otherTablesRows(kwFile):
+    for [tableName,rows] in kwFile.getOptionalFeaturesTables():
+        # logging.info('table:'+str(tableName))
+        yield ['Table:'+tableName]
+        for row in rows:
+            yield row
+        yield [] # blank line to separate from next table
+
+def writeChannelCsv(kwFile,chanFileName):
+    with open(chanFileName,'w',newline='') as csvFile:
+        csvWriter=csv.writer(csvFile)
+        header=['id']
+        for col in colKey:
+            header.append(col[1])
+        csvWriter.writerow(header)
+        rowNum=1
+        for d in kwFile.getAllChannelDicts():
+            # sort by a list of keys: https://stackoverflow.com/a/21773891
+            # row=sorted(d.items(),key=lambda pair: [h[0] for h in colKey].index(pair[0]))
+            # row=[rowNum]
+            row=[d['Zone Name']+':'+d['Channel Name']] # much more useful for diff than simple row number
+            for h in colKey:
+                row.append(d[h[0]])
+            csvWriter.writerow(row)
+            rowNum+=1
+        csvWriter.writerow(["## end"])
+
+def writeOtherTablesCsv(kwFile,otherFileName):
+    with open(otherFileName,'w',newline='') as csvFile:
+        csv.writer(csvFile).writerows(otherTablesRows(kwFile))
+
+# structured report of a run: a stream of events (dicts), written to the report file as each one is produced
+#  - fileName ending in .json: a JSON array of events, one per line; otherwise NDJSON (one event per line)
+#  - fileName None: the events are spooled to a temporary file, only to render the detailed log
+#  - every event has 'event' (its kind); see reportEventLines for the kinds and their text rendering
+#  - findings and differences identify channels by 'zone' and 'channel' (names), and values by 'field',
+#     'old' (reference or first file) and 'new'
+class ReportWriter():
+    def __init__(self,fileName=None):
+        self.fileName=fileName
+        self.isJson=bool(fileName) and os.path.splitext(fileName)[1].lower()=='.json'
+        if fileName:
+            self.file=open(fileName,'w+')
+        else:
+            import tempfile
+            self.file=tempfile.TemporaryFile('w+')
+        self.count=0
+        if self.isJson:
+            self.file.write('[\n')
+
+    def write(self,event):
+        import json
+        if self.isJson and self.count:
+            self.file.write(',\n')
+        self.file.write(json.dumps(event,default=str))
+        if not self.isJson:
+            self.file.write('\n')
+        self.count+=1
+
+    # the events written so far, read back from the file
+    def events(self):
+        self.file.flush()
+        self.file.seek(0)
+        yield from reportEvents(self.file)
+        self.file.seek(0,os.SEEK_END)
+
+    def close(self):
+        if self.isJson:
+            self.file.write('\n]\n')
+        self.file.close()
+
+# the events of a report file (or open file object) written by ReportWriter, in either format
+def reportEvents(f):
+    import json
+    if isinstance(f,str):
+        with open(f) as reportFile:
+            yield from reportEvents(reportFile)
+        return
+    for line in f:
+        line=line.strip().strip(',')
+        if line and line not in ['[',']']:
+            yield json.loads(line)
+
+# report file name for an input file: {name} and {dir} in pattern are replaced by the input file's base name
+#  (without extension) and directory, so that each input file can have its own report
+def reportFileName(pattern,srcFileName):
+    return pattern.replace('{name}',os.path.splitext(os.path.basename(srcFileName))[0]).replace('{dir}',os.path.dirname(srcFileName) or '.')
+
+# structured description of a channel, for report events
+def channelInfo(d):
+    return {'zone':d.zoneName,'zoneNumber':d.get('Zone Number'),'channel':d.channelName,'channelNumber':d.get('Channel Number')}
+
+def findingEvent(finding,srcFileName,ruleNum,lines):
+    issues=[]
+    for issue in finding.issues:
+        d=finding.records[issue.recordIndex]
+        issues.append({'zone':d.zoneName,'channel':d.channelName,'field':issue.field,'old':issue.refValue,'new':issue.value,'severity':issue.severity})
+    return {
+        'event':'finding',
+        'file':srcFileName,
+        'part':ruleNum+1,
+        'rule':finding.rule.__class__.__name__,
+        'key':finding.key,
+        'discrepancies':finding.discrepancyCount(),
+        'channels':[channelInfo(d) for d in finding.records],
+        'issues':issues,
+        'text':lines}
+
+# lines of the text report (the detailed log) for a report event
+#  - check: the heading of one part of the internal consistency checks of a file
+#  - finding: one Finding of that check (text is the rule's formatFinding lines)
+#  - checkDone: end of the check; discrepancies is its total
+#  - comparison: the heading of the comparison of two files, followed by difference events
+#  - difference: one channel or Optional Features table difference (text is its comparisonLines lines)
+#  - comparisonDone: end of the comparison; differences is the number of difference events
+def reportEventLines(event):
+    kind=event['event']
+    if kind=='check':
+        return ['-----------------------------------------'
+            ,'INTERNAL CONSISTENCY CHECK for '+event['label']+' : '+event['file']
+            ,'  Part '+str(event['part'])+': '+event['description'][0]]+['  '+line for line in event['description'][1:]]+[
+            '-----------------------------------------']
+    if kind=='checkDone':
+        return [] if event['discrepancies'] else ['No discrepancies found for this check.']
+    if kind=='comparison':
+        return ['-----------------------------------------'
+            ,'COMPARISON of '+event['label1']+' vs. '+event['label2']+' : '+event['file2']
+            ,'-----------------------------------------']
+    if kind=='comparisonDone':
+        return [] if event['differences'] else ['No differences found.']
+    return event.get('text',[])
+
+# lines of the detailed log for a stream of report events; comparisons that were already logged as they were
+#  written (see writeComparison) are left out
+def detailedLogLines(events):
+    skip=False
+    for event in events:
+        if event['event']=='comparison':
+            skip=event.get('logged',False)
+        if not skip:
+            yield from reportEventLines(event)
+        if event['event']=='comparisonDone':
+            skip=False
+
+# parse one exported file, optionally generate its .csv files, and run the internal consistency checks
+#  - context is the CheckContext passed to the rules
+#  - detailed results are written to report (a ReportWriter); discrepancies are also logged as they are found
+#  - returns [kwFile,chanFileName,otherFileName,discrepancyCounts] where discrepancyCounts has one entry per check
+#     (the file names are None if writeCsv is False)
+#  - raises ValueError if the file was not exported from KPG-D1N
+def processFile(srcFileName,fileLabel,context,report,parser='auto',cache=None,ruleThreads=1,writeCsv=True):
+    [chanFileName,otherFileName]=[None,None]
+    if writeCsv:
+        [chanFileName,otherFileName]=getOutputFileNames(srcFileName)
+    kwFile=KWFile(srcFileName,parser=parser,cache=cache)
+    kpg=kwFile.heading or ''
+    if 'KPG-D1N' not in kpg:
+        raise ValueError('only KPG-D1N html files are currently supported')
+
+    if writeCsv:
+        logging.info('Generating '+chanFileName+'...')
+        with runReport.phase('csv',srcFileName):
+            writeChannelCsv(kwFile,chanFileName)
+            writeOtherTablesCsv(kwFile,otherFileName)
+        logging.info('Done.')
+
+    logging.info('=========================================')
+    logging.info(fileLabel+': '+srcFileName)
+    logging.info('INTERNAL CONSISTENCY CHECKS - Summary of discrepancies:')
+    logging.info('=========================================')
+    discrepancyCounts=[]
+    with runReport.phase('indexes',srcFileName):
+        indexes=ChannelIndexes(kwFile.getAllChannelDicts(),rules)
+    allFindings=runRules(rules,indexes,context,ruleThreads,srcFileName)
+    for ruleNum in range(len(rules)):
+        rule=rules[ruleNum]
+        report.write({'event':'check','file':srcFileName,'label':fileLabel,'part':ruleNum+1,'rule':rule.__class__.__name__,'description':rule.description})
+        thisPartDiscrepancyCount=0
+        for finding in allFindings[ruleNum]:
+            logLines=rule.formatFinding(finding)
+            report.write(findingEvent(finding,srcFileName,ruleNum,logLines))
+            if finding.discrepancyCount():
+                thisPartDiscrepancyCount+=finding.discrepancyCount()
+                for line in logLines:
+                    logging.info(line)
+        report.write({'event':'checkDone','file':srcFileName,'part':ruleNum+1,'discrepancies':thisPartDiscrepancyCount})
+        discrepancyCounts.append(thisPartDiscrepancyCount)
+
+    runReport.addFile({
+        'file':srcFileName,
+        'label':fileLabel,
+        'fileBytes':os.path.getsize(srcFileName),
+        'channels':len(kwFile.getAllChannelDicts()),
+        'optionalFeaturesTables':len(kwFile.getOptionalFeaturesTables()),
+        'discrepancyCounts':discrepancyCounts})
+    return [kwFile,chanFileName,otherFileName,discrepancyCounts]
+
+colNames={c[0]:c[1] for c in colKey} # short column name for each channel field
+
+# value of a channel field for comparison, or None if the channel doesn't have it
+def fieldValue(d,field):
+    try:
+        return d.native(field)
+    except KeyError:
+        return None
+
+# {field:[value1,value2]} for each of the fields that differ between two channel records
+def fieldChanges(d1,d2,fields):
+    changes={}
+    for field in fields:
+        if fieldValue(d1,field)!=fieldValue(d2,field):
+            changes[field]=[d1.get(field),d2.get(field)]
+    return changes
+
+# stable digest of the given fields of a sequence of channel records; equal digests mean identical content
+def channelsHash(records,fields):
+    h=hashlib.blake2b(digest_size=16)
+    for d in records:
+        for field in fields:
+            h.update(str(d.get(field)).encode())
+            h.update(b'\x1f')
+        h.update(b'\x1e')
+    return h.hexdigest()
+
+# dict of lists of channel records, by zone name, in file order
+def groupByZone(records):
+    zones={}
+    for d in records:
+        zones.setdefault(d.zoneName,[]).append(d)
+    return zones
+
+# result of diffChannels; channel records come from the first table (removed), the second table (added),
+#  or both ([record1,record2,changes] for changed, moved and renamed, where changes is {field:[value1,value2]})
+class ChannelDiff():
+    def __init__(self):
+        self.added=[]
+        self.removed=[]
+        self.changed=[]
+        self.moved=[] # same TX/RX/Enc and channel name, in a different zone
+        self.renamed=[] # same TX/RX/Enc and zone, with a different channel name
+        self.identicalZones=0 # number of zones skipped because their content hashes matched
+
+    def isEmpty(self):
+        return not (self.added or self.removed or self.changed or self.moved or self.renamed)
+
+    # pair up removed and added channels that have the same TX/RX/Enc, as moves or renames
+    def findMovedAndRenamed(self,fields):
+        removedByTre={}
+        for d in self.removed:
+            removedByTre.setdefault((d.txHz,d.rxHz,d.encTone),[]).append(d)
+        matched=set()
+        added=[]
+        moveFields=[f for f in fields if f not in ['Zone Name','Channel Name']]
+        for d2 in self.added:
+            candidates=[d for d in removedByTre.get((d2.txHz,d2.rxHz,d2.encTone),[]) if d.key not in matched]
+            match=None
+            for d1 in candidates:
+                if d1.channelName==d2.channelName:
+                    match=d1
+                    self.moved.append([d1,d2,fieldChanges(d1,d2,moveFields)])
+                    break
+            if not match:
+                for d1 in candidates:
+                    if d1.zoneName==d2.zoneName:
+                        match=d1
+                        self.renamed.append([d1,d2,fieldChanges(d1,d2,moveFields)])
+                        break
+            if match:
+                matched.add(match.key)
+            else:
+                added.append(d2)
+        self.added=added
+        self.removed=[d for d in self.removed if d.key not in matched]
+
+# compare two channel collections (ChannelTables, or any sequences of ChannelRecords) in memory
+#  - channels are keyed by Zone Name:Channel Name; if a key appears more than once, the last one is used
+#  - fields: the channel fields to compare (default: the fields in the generated .csv files)
+#  - skipIdenticalZones: skip the channel-by-channel comparison of zones whose content hashes are equal
+#  - findMoves: pair up removed and added channels as moves and renames (see ChannelDiff.findMovedAndRenamed)
+def diffChannels(records1,records2,fields=None,skipIdenticalZones=True,findMoves=True):
+    if fields is None:
+        fields=[c[0] for c in colKey]
+    diff=ChannelDiff()
+    zones1=groupByZone(records1)
+    zones2=groupByZone(records2)
+    zoneNames=list(zones1.keys())+[z for z in zones2.keys() if z not in zones1]
+    for zoneName in zoneNames:
+        zoneRecords1=zones1.get(zoneName,[])
+        zoneRecords2=zones2.get(zoneName,[])
+        if skipIdenticalZones and zoneRecords1 and zoneRecords2 and channelsHash(zoneRecords1,fields)==channelsHash(zoneRecords2,fields):
+            diff.identicalZones+=1
+            continue
+        byName1={d.channelName:d for d in zoneRecords1}
+        byName2={d.channelName:d for d in zoneRecords2}
+        for [channelName,d1] in byName1.items():
+            d2=byName2.get(channelName)
+            if d2 is None:
+                diff.removed.append(d1)
+            else:
+                changes=fieldChanges(d1,d2,fields)
+                if changes:
+                    diff.changed.append([d1,d2,changes])
+        for [channelName,d2] in byName2.items():
+            if channelName not in byName1:
+                diff.added.append(d2)
+    if findMoves:
+        diff.findMovedAndRenamed(fields)
+    return diff
+
+# stable digest of an Optional Features table's rows
+def tableHash(rows):
+    h=hashlib.blake2b(digest_size=16)
+    for row in rows:
+        for cell in row:
+            h.update(str(cell).encode())
+            h.update(b'\x1f')
+        h.update(b'\x1e')
+    return h.hexdigest()
+
+# one difference between the Optional Features tables of two files
+#  - for a table that is in only one file, rowKey and column are None
+#  - for a row that is in only one table, column is None and value1 or value2 is the row (list of cells)
+#  - otherwise value1 and value2 are the differing cell strings
+class TableChange():
+    __slots__=('tableName','rowKey','column','value1','value2')
+
+    def __init__(self,tableName,rowKey=None,column=None,value1=None,value2=None):
+        self.tableName=tableName
+        self.rowKey=rowKey
+        self.column=column
+        self.value1=value1
+        self.value2=value2
+
+# key of each row of a table: its first (key) cell, plus an occurrence number if that cell is not unique
+def tableRowKeys(rows):
+    counts={}
+    keys=[]
+    for row in rows:
+        cell=row[0] if row else ''
+        counts[cell]=counts.get(cell,0)+1
+        keys.append(str(cell) if counts[cell]==1 else str(cell)+' ('+str(counts[cell])+')')
+    return keys
+
+def columnName(header,c):
+    if c<len(header) and header[c]:
+        return header[c]
+    return 'Column '+str(c+1)
+
+# compare the Optional Features tables of two files
+#  - tables are paired by their unique names (e.g. 'Scan:Table 2'), and tables with equal content hashes are skipped
+#  - within a table, rows are matched by their key cells (see tableRowKeys) using a sequence diff, so that
+#     inserted or deleted rows don't make every following row look different; matched rows are compared
+#     cell by cell, with columns named by the table's first (header) row
+#  - returns a list of TableChange
+def diffOptionalFeatures(tables1,tables2):
+    import difflib
+    changes=[]
+    byName2=dict([[name,rows] for [name,rows] in tables2])
+    names1=set()
+    for [tableName,rows1] in tables1:
+        names1.add(tableName)
+        rows2=byName2.get(tableName)
+        if rows2 is None:
+            changes.append(TableChange(tableName,value1=rows1))
+            continue
+        if tableHash(rows1)==tableHash(rows2):
+            continue
+        header=(rows1 or rows2)[0] if (rows1 or rows2) else []
+        keys1=tableRowKeys(rows1)
+        keys2=tableRowKeys(rows2)
+        matcher=difflib.SequenceMatcher(None,keys1,keys2,autojunk=False)
+        for [tag,i1,i2,j1,j2] in matcher.get_opcodes():
+            if tag=='equal':
+                for n in range(i2-i1):
+                    [row1,row2]=[rows1[i1+n],rows2[j1+n]]
+                    if row1!=row2:
+                        for c in range(max(len(row1),len(row2))):
+                            cell1=row1[c] if c<len(row1) else None
+                            cell2=row2[c] if c<len(row2) else None
+                            if cell1!=cell2:
+                                changes.append(TableChange(tableName,keys1[i1+n],columnName(header,c),cell1,cell2))
+            else:
+                for i in range(i1,i2):
+                    changes.append(TableChange(tableName,keys1[i],value1=rows1[i]))
+                for j in range(j1,j2):
+                    changes.append(TableChange(tableName,keys2[j],value2=rows2[j]))
+    for [tableName,rows2] in tables2:
+        if tableName not in names1:
+            changes.append(TableChange(tableName,value2=rows2))
+    return changes
+
+def cellsString(row):
+    return ', '.join(['' if cell is None else cell for cell in row])
+
+# report lines for the result of diffOptionalFeatures
+def tableChangeLines(tableChanges,label1='File 1',label2='File 2'):
+    lines=[]
+    for change in tableChanges:
+        if change.rowKey is None:
+            [label,rows]=[label1,change.value1] if change.value1 is not None else [label2,change.value2]
+            lines.append('  '+change.tableName+' : table only in '+label+' ('+str(len(rows))+' rows)')
+        elif change.column is None:
+            [label,row]=[label1,change.value1] if change.value1 is not None else [label2,change.value2]
+            lines.append('  '+change.tableName+' / '+change.rowKey+' : row only in '+label+' : '+cellsString(row))
+        else:
+            lines.append('  '+change.tableName+' / '+change.rowKey+' / '+change.column+' : '+str(change.value1)+' ('+label1+') -> '+str(change.value2)+' ('+label2+')')
+    return lines
+
+# compare two parsed files in memory
+#  - returns [channelDiff,tableChanges]: the diffChannels and diffOptionalFeatures results
+def compareFiles(kwFile1,kwFile2,fileName=None):
+    with runReport.phase('compare:channels',fileName):
+        channelDiff=diffChannels(kwFile1.getAllChannelDicts(),kwFile2.getAllChannelDicts())
+    with runReport.phase('compare:optionalFeatures',fileName):
+        tableChanges=diffOptionalFeatures(kwFile1.getOptionalFeaturesTables(),kwFile2.getOptionalFeaturesTables())
+    return [channelDiff,tableChanges]
+
+def zoneChannelId(d):
+    return str(d.zoneName)+':'+str(d.channelName)
+
+def changeLines(changes,label1,label2):
+    return ['  '+colNames.get(field,field)+' : '+str(changes[field][0])+' ('+label1+') vs. '+str(changes[field][1])+' ('+label2+')' for field in changes]
+
+def changeList(changes):
+    return [{'field':field,'old':changes[field][0],'new':changes[field][1]} for field in changes]
+
+# report events for the result of compareFiles: one difference event per added, removed, changed, moved or
+#  renamed channel and per Optional Features table change; the text of the first event of each kind includes
+#  the heading for that kind
+def comparisonEvents(channelDiff,tableChanges,label1='File 1',label2='File 2'):
+    def difference(kind,text,**fields):
+        return dict({'event':'difference','kind':kind},**fields,text=text)
+    heading=None
+    if len(channelDiff.added)>0 or len(channelDiff.removed)>0:
+        heading='Channel(s) were added or removed.  Only the zone:channel pair names are listed here as a summary; the visual diff tool should be used to see more detail.'
+    for [kind,records] in [['added',channelDiff.added],['removed',channelDiff.removed]]:
+        for d in records:
+            text=['  '+kind.capitalize()+': '+zoneChannelId(d)]
+            if heading:
+                [text,heading]=[[heading]+text,None]
+            yield difference(kind,text,zone=d.zoneName,channel=d.channelName)
+    if len(channelDiff.moved)>0 or len(channelDiff.renamed)>0:
+        heading='Channel(s) were moved or renamed (same TX/RX/Enc under a different zone or channel name):'
+    for [kind,pairs] in [['moved',channelDiff.moved],['renamed',channelDiff.renamed]]:
+        for [d1,d2,changes] in pairs:
+            text=['  '+kind.capitalize()+': '+zoneChannelId(d1)+' ('+label1+') -> '+zoneChannelId(d2)+' ('+label2+')']
+            text+=['  '+line for line in changeLines(changes,label1,label2)]
+            if heading:
+                [text,heading]=[[heading]+text,None]
+            yield difference(kind,text,zone=d1.zoneName,channel=d1.channelName,newZone=d2.zoneName,newChannel=d2.channelName,changes=changeList(changes))
+    for [d,d2,changes] in channelDiff.changed:
+        text=['Zone '+str(d['Zone Number'])+' ('+d['Zone Name']+')  Channel '+str(d['Channel Number'])+' ('+d['Channel Name']+') : ']
+        yield difference('changed',text+changeLines(changes,label1,label2),zone=d.zoneName,channel=d.channelName,changes=changeList(changes))
+    heading='Differences were found in the other tables:'
+    for change in tableChanges:
+        text=tableChangeLines([change],label1,label2)
+        if heading:
+            [text,heading]=[[heading]+text,None]
+        yield difference('table',text,table=change.tableName,row=change.rowKey,column=change.column,old=change.value1,new=change.value2)
+
+# summary lines for the result of compareFiles
+def comparisonLines(channelDiff,tableChanges,label1='File 1',label2='File 2'):
+    return [line for event in comparisonEvents(channelDiff,tableChanges,label1,label2) for line in event['text']]
+
+# write the comparison of two files to report, with its heading, and optionally log its text as it is written
+#  - returns the number of differences
+def writeComparison(report,channelDiff,tableChanges,fileName1,fileName2,label1='File 1',label2='File 2',log=False):
+    report.write({'event':'comparison','file1':fileName1,'file2':fileName2,'label1':label1,'label2':label2,'logged':log})
+    n=0
+    for event in comparisonEvents(channelDiff,tableChanges,label1,label2):
+        report.write(event)
+        n+=1
+        if log:
+            for line in event['text']:
+                logging.info(line)
+    report.write({'event':'comparisonDone','file1':fileName1,'file2':fileName2,'differences':n})
+    return n
+
+batchReference=None # reference KWFile, loaded once in each batch worker process
+
+def configureBatchWorker(ruleFiles=[],referenceFileName=None,parser='auto',cacheDir=None,cacheMaxBytes=DEFAULT_CACHE_MAX_BYTES,report=False,traceMemory=False):
+    global batchReference,runReport
+    runReport=RunReport(enabled=report,traceMemory=traceMemory)
+    # workers report back to the main process; keep their own progress messages off the console and log file
+    logging.getLogger().setLevel(logging.WARNING)
+    # (rule files are already loaded if the worker was forked from the main process)
+    for ruleFile in ruleFiles:
+        loadRuleFile(ruleFile)
+    if referenceFileName:
+        cache=None
+        if cacheDir:
+            cache=ParseCache(cacheDir,cacheMaxBytes)
+        batchReference=KWFile(referenceFileName,parser=parser,cache=cache)
+
+# process one radio's export in batch mode and compare it against the reference export
+#  (runs in a worker process; everything needed by the summary is returned, since nothing is shared)
+#  - the detailed results are written to the report file reportFileName (see ReportWriter)
+#  - with snapshotFileName, a snapshot of the export is also stored in that snapshot database (see SnapshotStore)
+def batchWorker(srcFileName,context,parser,cacheDir,cacheMaxBytes,reportFileName,ruleThreads=1,writeCsv=True,snapshotFileName=None):
+    result={'fileName':srcFileName,'error':None,'discrepancyCounts':[],'added':0,'removed':0,'changed':0,'moved':0,'renamed':0,'otherTablesDiffs':0,
+        'reportFileName':reportFileName,'phases':[],'files':[],'frequencies':[]}
+    # this worker's runReport accumulates over all the files it processes; return just this file's part
+    [phaseStart,fileStart]=[len(runReport.phases),len(runReport.files)]
+    cache=None
+    if cacheDir:
+        cache=ParseCache(cacheDir,cacheMaxBytes)
+    report=None
+    try:
+        report=ReportWriter(reportFileName)
+        [kwFile,chanFileName,otherFileName,discrepancyCounts]=processFile(srcFileName,'Radio',context,report,parser,cache,ruleThreads,writeCsv)
+        [channelDiff,tableChanges]=compareFiles(batchReference,kwFile,srcFileName)
+        writeComparison(report,channelDiff,tableChanges,batchReference.fileName,srcFileName,'Reference','Radio')
+        if snapshotFileName:
+            with runReport.phase('snapshot',srcFileName):
+                storeSnapshot(snapshotFileName,kwFile)
+    except Exception as e:
+        result['error']=str(e)
+        return result
+    finally:
+        if report:
+            report.close()
+        result['phases']=runReport.phases[phaseStart:]
+        result['files']=runReport.files[fileStart:]
+    result['discrepancyCounts']=discrepancyCounts
+    result['frequencies']=sorted(set([hz for [hz,d] in channelFrequencies(kwFile.getAllChannelDicts())]))
+    for kind in ['added','removed','changed','moved','renamed']:
+        result[kind]=len(getattr(channelDiff,kind))
+    result['otherTablesDiffs']=len(tableChanges)
+    return result
+
+# descriptions of the comparison counts of a batchWorker or matrixDiffWorker result (empty if there are no differences)
+def comparisonSummaryParts(result,against='reference'):
+    parts=[]
+    if result['added'] or result['removed'] or result['changed'] or result['moved'] or result['renamed']:
+        parts.append('channels vs. '+against+': '+', '.join([str(result[kind])+' '+kind for kind in ['added','removed','changed','moved','renamed'] if result[kind]]))
+    if result['otherTablesDiffs']:
+        parts.append(str(result['otherTablesDiffs'])+' other tables differences vs. '+against)
+    return parts
+
+# one-line description of a batchWorker result, for progress and summary output
+def batchResultSummary(result):
+    if result['error']:
+        return 'ERROR: '+result['error']
+    parts=[]
+    nDiscrepancies=sum(result['discrepancyCounts'])
+    if nDiscrepancies:
+        parts.append(str(nDiscrepancies)+' internal discrepancies (Part '+', Part '.join([str(n+1)+': '+str(result['discrepancyCounts'][n]) for n in range(len(result['discrepancyCounts']))])+')')
+    parts+=comparisonSummaryParts(result)
+    if not parts:
+        return 'OK'
+    return '; '.join(parts)
+
+def isDeviating(result):
+    return batchResultSummary(result)!='OK'
+
+# fleet-wide frequency proximity: distinct frequencies within proximityHz of each other that are used by
+#  different radios (pairs used only within one radio are already reported by that radio's FrequencyProximityRule)
+#  - fileFrequencies is {file name: distinct frequencies in Hz}
+#  - returns [hz1,hz2,files using hz1,files using hz2] for each such pair
+def fleetFrequencyProximity(fileFrequencies,proximityHz):
+    frequencyIndex=FrequencyIndex([[hz,fileName] for [fileName,frequencies] in fileFrequencies.items() for hz in frequencies])
+    pairs=[]
+    for [hz1,hz2] in frequencyIndex.pairsWithin(proximityHz):
+        [files1,files2]=[frequencyIndex.items[hz1],frequencyIndex.items[hz2]]
+        if len(set(files1)|set(files2))>1:
+            pairs.append([hz1,hz2,files1,files2])
+    return pairs
+
+# expand the --batch arguments (directories, glob patterns, or file names) into a sorted list of exported files
+def findBatchFiles(patterns):
+    import glob
+    fileNames=set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            fileNames.update(glob.glob(os.path.join(pattern,'*.htm')))
+        else:
+            fileNames.update([f for f in glob.glob(pattern) if os.path.isfile(f)])
+    return sorted(fileNames)
+
+# N-way comparison (matrix mode): compare any number of exports with each other using content hashes
+#  - each export is parsed in a worker process, which returns only its fingerprint (exportFingerprint)
+#  - exports with the same overall hash are identical, and are grouped into clusters; the zones and tables that
+#     differ between two clusters are found by comparing their fingerprints, without looking at any channels
+#  - field-level diffs are run (again in worker processes) only between each cluster and the baseline cluster
+#     (the reference's cluster, or else the largest one), and only on the zones and tables whose hashes differ;
+#     the parse cache makes reading each export again cheap
+
+# content hashes of a parsed export: per zone, per channel (by zone and channel name), per Optional Features
+#  table, and for the whole export; equal hashes mean identical content in the compared fields
+def exportFingerprint(kwFile,fields=None):
+    if fields is None:
+        fields=[c[0] for c in colKey]
+    zones=groupByZone(kwFile.getAllChannelDicts())
+    zoneHashes={zoneName:channelsHash(records,fields) for [zoneName,records] in zones.items()}
+    channelHashes={zoneName:{d.channelName:channelsHash([d],fields) for d in records} for [zoneName,records] in zones.items()}
+    tableHashes={tableName:tableHash(rows) for [tableName,rows] in kwFile.getOptionalFeaturesTables()}
+    h=hashlib.blake2b(digest_size=16)
+    for hashes in [zoneHashes,tableHashes]:
+        for [name,contentHash] in hashes.items():
+            h.update((str(name)+'\x1f'+contentHash+'\x1e').encode())
+        h.update(b'\x1d')
+    return {'fileName':kwFile.fileName,'hash':h.hexdigest(),'channelCount':len(kwFile.getAllChannelDicts()),
+        'zones':zoneHashes,'channels':channelHashes,'tables':tableHashes}
+
+# [zone names,table names] whose hashes differ between two fingerprints (including those in only one of them)
+#  - zones are in the order of the first fingerprint, followed by zones that are only in the second
+def fingerprintDifferences(fingerprint1,fingerprint2):
+    differences=[]
+    for kind in ['zones','tables']:
+        [hashes1,hashes2]=[fingerprint1[kind],fingerprint2[kind]]
+        names=list(hashes1.keys())+[name for name in hashes2.keys() if name not in hashes1]
+        differences.append([name for name in names if hashes1.get(name)!=hashes2.get(name)])
+    return differences
+
+# number of channels whose hashes differ between two fingerprints, in the given zones
+def channelDifferenceCount(fingerprint1,fingerprint2,zoneNames):
+    n=0
+    for zoneName in zoneNames:
+        [hashes1,hashes2]=[fingerprint1['channels'].get(zoneName,{}),fingerprint2['channels'].get(zoneName,{})]
+        n+=len([name for name in set(hashes1)|set(hashes2) if hashes1.get(name)!=hashes2.get(name)])
+    return n
+
+# group fingerprints with equal overall hashes; returns a list of clusters (lists of fingerprints), largest
+#  first (ties in order of their first file name), each in file name order
+def clusterFingerprints(fingerprints):
+    clusters={}
+    for fingerprint in sorted(fingerprints,key=lambda f: f['fileName']):
+        clusters.setdefault(fingerprint['hash'],[]).append(fingerprint)
+    return sorted(clusters.values(),key=lambda c: (-len(c),c[0]['fileName']))
+
+# parse one export and return its fingerprint (runs in a worker process; see configureBatchWorker)
+def matrixFingerprintWorker(srcFileName,parser,cacheDir,cacheMaxBytes):
+    [phaseStart,fileStart]=[len(runReport.phases),len(runReport.files)]
+    cache=None
+    if cacheDir:
+        cache=ParseCache(cacheDir,cacheMaxBytes)
+    try:
+        kwFile=KWFile(srcFileName,parser=parser,cache=cache)
+        if 'KPG-D1N' not in (kwFile.heading or ''):
+            raise ValueError('only KPG-D1N html files are currently supported')
+        with runReport.phase('fingerprint',srcFileName):
+            result=exportFingerprint(kwFile)
+        runReport.addFile({
+            'file':srcFileName,
+            'label':'Matrix',
+            'fileBytes':os.path.getsize(srcFileName),
+            'channels':len(kwFile.getAllChannelDicts()),
+            'optionalFeaturesTables':len(kwFile.getOptionalFeaturesTables()),
+            'discrepancyCounts':[]}) # internal consistency checks are not run in matrix mode
+    except Exception as e:
+        result={'fileName':srcFileName,'error':str(e)}
+    result['phases']=runReport.phases[phaseStart:]
+    result['files']=runReport.files[fileStart:]
+    return result
+
+# field-level comparison of two exports, limited to the given zones and Optional Features tables
+#  (runs in a worker process); the comparison is written to the report file reportFileName
+#  - returns {'added':n,...,'otherTablesDiffs':n,'error':None or message,'phases':[...]}
+def matrixDiffWorker(fileName1,fileName2,zoneNames,tableNames,label1,label2,parser,cacheDir,cacheMaxBytes,reportFileName):
+    result={'added':0,'removed':0,'changed':0,'moved':0,'renamed':0,'otherTablesDiffs':0,'error':None,'phases':[]}
+    phaseStart=len(runReport.phases)
+    cache=None
+    if cacheDir:
+        cache=ParseCache(cacheDir,cacheMaxBytes)
+    report=None
+    try:
+        report=ReportWriter(reportFileName)
+        [kwFile1,kwFile2]=[KWFile(fileName,parser=parser,cache=cache) for fileName in [fileName1,fileName2]]
+        [zoneNames,tableNames]=[set(zoneNames),set(tableNames)]
+        with runReport.phase('compare:channels',fileName2):
+            channelDiff=diffChannels([d for d in kwFile1.getAllChannelDicts() if d.zoneName in zoneNames],
+                    [d for d in kwFile2.getAllChannelDicts() if d.zoneName in zoneNames],skipIdenticalZones=False)
+        with runReport.phase('compare:optionalFeatures',fileName2):
+            tableChanges=diffOptionalFeatures([t for t in kwFile1.getOptionalFeaturesTables() if t[0] in tableNames],
+                    [t for t in kwFile2.getOptionalFeaturesTables() if t[0] in tableNames])
+        writeComparison(report,channelDiff,tableChanges,fileName1,fileName2,label1,label2)
+    except Exception as e:
+        result['error']=str(e)
+        return result
+    finally:
+        if report:
+            report.close()
+        result['phases']=runReport.phases[phaseStart:]
+    for kind in ['added','removed','changed','moved','renamed']:
+        result[kind]=len(getattr(channelDiff,kind))
+    result['otherTablesDiffs']=len(tableChanges)
+    return result
+
+# lines of the cluster-by-cluster matrix: the number of zones (plus Optional Features tables, after a '+')
+#  whose hashes differ between each pair of clusters
+def clusterMatrixLines(clusters):
+    n=len(clusters)
+    cells=[['-']*n for i in range(n)]
+    for i in range(n):
+        for j in range(i+1,n):
+            [zoneNames,tableNames]=fingerprintDifferences(clusters[i][0],clusters[j][0])
+            cells[i][j]=cells[j][i]=str(len(zoneNames))+('+'+str(len(tableNames)) if tableNames else '')
+    width=max([len(cell) for row in cells for cell in row]+[len(str(n))+1])
+    lines=['     '+''.join([('C'+str(j+1)).rjust(width+2) for j in range(n)])]
+    for i in range(n):
+        lines.append(('C'+str(i+1)).ljust(5)+''.join([cells[i][j].rjust(width+2) for j in range(n)]))
+    return lines
+
+# watch mode: re-check exports each time they are saved, re-using the previous results for unchanged zones
+#  - each watched file keeps its channel records, grouping indexes, and findings in memory (WatchedExport)
+#  - when a file changes it is parsed again (KPG-D1N rewrites the whole file on every export, so it has to be
+#     read in full), but only the zones whose content hashes changed are swapped into the indexes, and only
+#     the groups and channels they touch are re-checked and re-compared against the reference
+#  - files are polled for changes to their modification time and size, so no extra packages are needed
+
+DEFAULT_WATCH_INTERVAL=0.5 # seconds between polls
+WATCH_SETTLE_SECONDS=0.1 # a file whose size or modification time changes within this time is still being written
+
+# (modification time,size) of a file, or None if it doesn't exist
+def fileSignature(fileName):
+    try:
+        st=os.stat(fileName)
+    except OSError:
+        return None
+    return (st.st_mtime_ns,st.st_size)
+
+def ruleChecksIncrementally(rule):
+    # rules that override check() itself can't be run on part of the channels; they are re-run in full
+    return type(rule).check is ConsistencyRule.check
+
+# the in-memory state of one watched export; it also serves as the indexes passed to rules (see ChannelIndexes)
+class WatchedExport():
+    def __init__(self,fileName,context=None):
+        self.fileName=fileName
+        self.context=context or CheckContext()
+        self.signature=None
+        self.kwFile=None
+        self.zoneNames=[] # in file order
+        self.zoneRecords={} # zone name: list of channel records
+        self.zoneHashes={} # zone name: channelsHash of all of the zone's fields
+        self.records=[] # all channel records, in zone order (records of unchanged zones are kept from earlier versions)
+        self.position={} # record.key: index in records
+        self.groups={} # grouping name: {key: list of records}, as in ChannelIndexes
+        for rule in rules:
+            if rule.grouping:
+                self.groups.setdefault(rule.grouping,{})
+        self.frequencyIndex=None # rebuilt on each change, if a rule uses it
+        self.findings=[{} for rule in rules] # per rule: {grouping key, or record.key for rules without a grouping: Finding}
+        self.zoneDiffs=None # zone name: ChannelDiff against the reference (moves are paired up in channelDiff)
+        self.tableChanges=[]
+
+    # swap the zones of a newly parsed version of the file into the indexes, and re-check what they touch
+    #  - returns [changedZones,touched]: the names of the zones whose content changed, and for each rule
+    #     [old findings,new findings] that were replaced
+    def update(self,kwFile,signature):
+        table=kwFile.getAllChannelDicts()
+        zones=groupByZone(table)
+        hashes={zoneName:channelsHash(records,table.fieldNames) for [zoneName,records] in zones.items()}
+        if [z for z in zones if z in self.zoneRecords]!=[z for z in self.zoneNames if z in zones]:
+            # zones were reordered; the order of every group may have changed, so re-check everything
+            changedZones=list(zones.keys())+[z for z in self.zoneNames if z not in zones]
+        else:
+            changedZones=[z for z in zones if hashes[z]!=self.zoneHashes.get(z)]+[z for z in self.zoneNames if z not in zones]
+        self.signature=signature
+        self.kwFile=kwFile
+        oldRecords=[d for z in changedZones for d in self.zoneRecords.get(z,[])]
+        newRecords=[d for z in changedZones for d in zones.get(z,[])]
+        for zoneName in changedZones:
+            if zoneName in zones:
+                self.zoneRecords[zoneName]=zones[zoneName]
+                self.zoneHashes[zoneName]=hashes[zoneName]
+            else:
+                del self.zoneRecords[zoneName]
+                del self.zoneHashes[zoneName]
+        self.zoneNames=list(zones.keys())
+        self.records=[d for z in self.zoneNames for d in self.zoneRecords[z]]
+        self.position={d.key:n for [n,d] in enumerate(self.records)}
+
+        # update only the groups that old or new records of the changed zones belong to
+        oldKeys=set(d.key for d in oldRecords)
+        affectedKeys={}
+        for [name,groups] in self.groups.items():
+            keyFunction=groupings[name]
+            added={}
+            for d in newRecords:
+                added.setdefault(keyFunction(d),[]).append(d)
+            keys=set(keyFunction(d) for d in oldRecords)|set(added.keys())
+            for key in keys:
+                records=[d for d in groups.get(key,[]) if d.key not in oldKeys]+added.get(key,[])
+                if records:
+                    records.sort(key=lambda d: self.position[d.key])
+                    groups[key]=records
+                else:
+                    groups.pop(key,None)
+            affectedKeys[name]=keys
+        if [rule for rule in rules if rule.usesFrequencyIndex]:
+            self.frequencyIndex=FrequencyIndex(channelFrequencies(self.records))
+
+        touched=[]
+        for ruleNum in range(len(rules)):
+            rule=rules[ruleNum]
+            findings=self.findings[ruleNum]
+            with runReport.phase('check:'+rule.__class__.__name__,self.fileName):
+                if not ruleChecksIncrementally(rule):
+                    touched.append([list(findings.values()),rule.check(self,self.context)])
+                    self.findings[ruleNum]=dict(enumerate(touched[-1][1]))
+                    continue
+                [old,new]=[[],[]]
+                if rule.grouping:
+                    groups=self.groups[rule.grouping]
+                    changes=[[key,groups[key] if key in groups else None] for key in affectedKeys[rule.grouping]]
+                    for [key,records] in changes:
+                        if key in findings:
+                            old.append(findings.pop(key))
+                        finding=rule.checkGroup(key,records,self.context) if records else None
+                        if finding:
+                            findings[key]=finding
+                            new.append(finding)
+                else:
+                    for d in oldRecords:
+                        if d.key in findings:
+                            old.append(findings.pop(d.key))
+                    for d in newRecords:
+                        finding=rule.checkRecord(d,self.context)
+                        if finding:
+                            findings[d.key]=finding
+                            new.append(finding)
+                touched.append([old,new])
+        return [changedZones,touched]
+
+    def discrepancyCounts(self):
+        return [sum([f.discrepancyCount() for f in self.findings[ruleNum].values()]) for ruleNum in range(len(rules))]
+
+    # re-compare the given zones (all zones of both files if zoneNames is None) against the reference
+    def compareZones(self,reference,zoneNames=None):
+        if zoneNames is None or self.zoneDiffs is None:
+            self.zoneDiffs={}
+            zoneNames=set(reference.zoneNames)|set(self.zoneNames)
+        for zoneName in zoneNames:
+            records1=reference.zoneRecords.get(zoneName,[])
+            records2=self.zoneRecords.get(zoneName,[])
+            if records1 or records2:
+                self.zoneDiffs[zoneName]=diffChannels(records1,records2,findMoves=False)
+            else:
+                self.zoneDiffs.pop(zoneName,None)
+        self.tableChanges=diffOptionalFeatures(reference.kwFile.getOptionalFeaturesTables(),self.kwFile.getOptionalFeaturesTables())
+
+    # the combined diffChannels result of all zones, with moves and renames paired up
+    def channelDiff(self,reference):
+        diff=ChannelDiff()
+        for zoneName in reference.zoneNames+[z for z in self.zoneNames if z not in reference.zoneRecords]:
+            zoneDiff=self.zoneDiffs.get(zoneName)
+            if zoneDiff:
+                diff.added+=zoneDiff.added
+                diff.removed+=zoneDiff.removed
+                diff.changed+=zoneDiff.changed
+                diff.identicalZones+=zoneDiff.identicalZones
+        diff.findMovedAndRenamed([c[0] for c in colKey])
+        return diff
+
+# the part of a ChannelDiff that involves the given zones
+def zonesChannelDiff(channelDiff,zoneNames):
+    diff=ChannelDiff()
+    diff.added=[d for d in channelDiff.added if d.zoneName in zoneNames]
+    diff.removed=[d for d in channelDiff.removed if d.zoneName in zoneNames]
+    for kind in ['changed','moved','renamed']:
+        setattr(diff,kind,[c for c in getattr(channelDiff,kind) if c[0].zoneName in zoneNames or c[1].zoneName in zoneNames])
+    return diff
+
+# poll the watched exports (and the reference) for changes, and report what each change did to the results
+#  - with snapshotFileName, each version of each file that is read is also stored in that snapshot database
+class Watcher():
+    def __init__(self,patterns,context,referenceFileName=None,parser='auto',cache=None,writeCsv=True,interval=DEFAULT_WATCH_INTERVAL,snapshotFileName=None):
+        self.patterns=patterns
+        self.context=context
+        self.parser=parser
+        self.cache=cache
+        self.writeCsv=writeCsv
+        self.interval=interval
+        self.snapshots=SnapshotStore(snapshotFileName) if snapshotFileName else None
+        self.reference=None
+        if referenceFileName:
+            self.reference=WatchedExport(referenceFileName,context)
+        self.exports={} # file name: WatchedExport
+        self.failed={} # file name: signature of the version that could not be read
+
+    def watchedFileNames(self):
+        fileNames=findBatchFiles(self.patterns)
+        if self.reference:
+            fileNames=[f for f in fileNames if os.path.abspath(f)!=os.path.abspath(self.reference.fileName)]
+        return fileNames
+
+    def poll(self):
+        referenceZones=None
+        if self.reference:
+            referenceZones=self.updateExport(self.reference,'Reference')
+            if self.reference.kwFile is None:
+                return # nothing to compare against until the reference can be read
+        fileNames=self.watchedFileNames()
+        for fileName in list(self.exports.keys()):
+            if fileName not in fileNames:
+                logging.info('=========================================')
+                logging.info(fileName+' no longer found; stopped watching it')
+                del self.exports[fileName]
+        for fileName in fileNames:
+            if fileName not in self.exports:
+                self.exports[fileName]=WatchedExport(fileName,self.context)
+            self.updateExport(self.exports[fileName],'File',referenceZones)
+
+    def run(self):
+        logging.info('=========================================')
+        logging.info('Watching '+', '.join(self.patterns)+(' against reference '+self.reference.fileName if self.reference else '')+' (press Ctrl+C to stop)')
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            logging.info('Stopped watching.')
+
+    # re-check an export if it changed, and re-compare it against the reference if either one changed
+    #  - returns the names of the export's zones that changed, or None if it did not change
+    def updateExport(self,export,label,referenceZones=None):
+        fileName=export.fileName
+        signature=fileSignature(fileName)
+        changedZones=None
+        if signature is not None and signature!=export.signature and signature!=self.failed.get(fileName):
+            time.sleep(WATCH_SETTLE_SECONDS)
+            if fileSignature(fileName)!=signature:
+                return None # still being written; try again on the next poll
+            firstLoad=export.kwFile is None
+            t0=time.perf_counter()
+            try:
+                kwFile=KWFile(fileName,parser=self.parser,cache=self.cache)
+                if 'KPG-D1N' not in (kwFile.heading or ''):
+                    raise ValueError('only KPG-D1N html files are currently supported')
+            except Exception as e:
+                logging.error('ERROR reading '+fileName+': '+str(e)+' (will try again when it changes)')
+                self.failed[fileName]=signature
+                return None
+            self.failed.pop(fileName,None)
+            t1=time.perf_counter()
+            [changedZones,touched]=export.update(kwFile,signature)
+            t2=time.perf_counter()
+            if self.writeCsv:
+                [chanFileName,otherFileName]=getOutputFileNames(fileName)
+                with runReport.phase('csv',fileName):
+                    writeChannelCsv(kwFile,chanFileName)
+                    writeOtherTablesCsv(kwFile,otherFileName)
+            if self.snapshots:
+                with runReport.phase('snapshot',fileName):
+                    self.snapshots.add(kwFile)
+            logging.info('=========================================')
+            if firstLoad:
+                changeString='loaded '+str(len(export.records))+' channels in '+str(len(export.zoneNames))+' zone(s)'
+            else:
+                changeString=str(len(changedZones))+' of '+str(len(export.zoneNames))+' zone(s) changed'
+                if changedZones:
+                    changeString+=' ('+', '.join([str(z) for z in changedZones[:10]])+(', ...' if len(changedZones)>10 else '')+')'
+            logging.info(time.strftime('%H:%M:%S')+' '+label+': '+fileName+' : '+changeString+'; parsed in %.3f s, re-checked in %.3f s' % (t1-t0,t2-t1))
+            self.logFindings(export,touched)
+        if export.kwFile is None or (changedZones is None and not referenceZones):
+            return changedZones
+        if self.reference and export is not self.reference:
+            if changedZones is None:
+                logging.info('=========================================')
+                logging.info(time.strftime('%H:%M:%S')+' '+label+': '+export.fileName+' : reference changed')
+            if export.zoneDiffs is None:
+                self.logComparison(export)
+            else:
+                self.logComparison(export,set(changedZones or [])|set(referenceZones or []))
+        return changedZones
+
+    # discrepancy counts, and the findings with discrepancies that appeared or went away
+    def logFindings(self,export,touched):
+        counts=export.discrepancyCounts()
+        for ruleNum in range(len(rules)):
+            [old,new]=touched[ruleNum]
+            rule=rules[ruleNum]
+            oldLines={tuple(rule.formatFinding(f)) for f in old if f.discrepancyCount()}
+            newLines=[tuple(rule.formatFinding(f)) for f in new if f.discrepancyCount()]
+            added=[lines for lines in newLines if lines not in oldLines]
+            resolved=len(oldLines-set(newLines))
+            logging.info('  Part '+str(ruleNum+1)+': '+str(counts[ruleNum])+' discrepancies ('+str(len(added))+' new or changed, '+str(resolved)+' resolved)')
+            for lines in added:
+                for line in lines:
+                    logging.info('  '+line)
+
+    # comparison counts, and the differences in the zones that changed in either file
+    #  (zoneNames None: the first comparison of this export; all differences are listed)
+    def logComparison(self,export,zoneNames=None):
+        t0=time.perf_counter()
+        previousTableLines=set(tableChangeLines(export.tableChanges,'Reference','File'))
+        with runReport.phase('compare',export.fileName):
+            export.compareZones(self.reference,zoneNames)
+            channelDiff=export.channelDiff(self.reference)
+        parts=[str(len(getattr(channelDiff,kind)))+' '+kind for kind in ['added','removed','changed','moved','renamed'] if getattr(channelDiff,kind)]
+        if export.tableChanges:
+            parts.append(str(len(export.tableChanges))+' other tables differences')
+        logging.info('  vs. Reference: '+(', '.join(parts) or 'no differences')+' (re-compared in %.3f s)' % (time.perf_counter()-t0))
+        if zoneNames is not None:
+            channelDiff=zonesChannelDiff(channelDiff,zoneNames)
+        tableChanges=[c for c in export.tableChanges if tableChangeLines([c],'Reference','File')[0] not in previousTableLines]
+        for line in comparisonLines(channelDiff,tableChanges,'Reference','File'):
+            logging.info('  '+line)
 
 if __name__=="__main__":
+    import argparse
+    argParser=argparse.ArgumentParser(description='Parse and inspect .htm file(s) exported from KPG-D1N; if two files are specified, compare them.')
+    argParser.add_argument('fileNames',nargs='*',metavar='file',help='.htm file exported from KPG-D1N (one or two files)')
+    argParser.add_argument('--parser',choices=['auto','soup','stream'],default='auto',
+            help='html parser to use: soup (full BeautifulSoup tree), stream (event-driven, low memory), or auto (stream for files larger than '+str(STREAMING_THRESHOLD_BYTES//(1024*1024))+' MB) (default: auto)')
+    argParser.add_argument('--no-cache',action='store_true',help='always parse the html files, without reading or writing the parse cache')
+    argParser.add_argument('--clear-cache',action='store_true',help='remove all entries from the parse cache before processing (files are optional with this option)')
+    argParser.add_argument('--cache-dir',default=DEFAULT_CACHE_DIR,help='parse cache directory (default: '+DEFAULT_CACHE_DIR+')')
+    argParser.add_argument('--cache-size',type=int,default=DEFAULT_CACHE_MAX_BYTES//(1024*1024),metavar='MB',
+            help='maximum total size of the parse cache; least recently used entries are removed beyond this (default: '+str(DEFAULT_CACHE_MAX_BYTES//(1024*1024))+')')
+    argParser.add_argument('--synonyms',action='append',metavar='FILE',
+            help='channel name synonyms file; can be specified more than once to merge several files (default: synonyms.txt, if it exists)')
+    argParser.add_argument('--rules',action='append',default=[],metavar='FILE',
+            help='python file defining additional internal consistency rules; can be specified more than once')
+    argParser.add_argument('--rule-threads',type=int,default=1,metavar='N',
+            help='number of threads used to run the internal consistency rules over the shared channel indexes; ignored with --profile or --trace-memory, which need the rules run one at a time (default: 1)')
+    argParser.add_argument('--proximity',type=float,default=DEFAULT_PROXIMITY_HZ/1000,metavar='KHZ',
+            help='report distinct frequencies that are no more than this far apart, in each file and (in batch mode) across the fleet (default: '+str(DEFAULT_PROXIMITY_HZ/1000)+')')
+    argParser.add_argument('--repeater-offset',action='append',metavar='LOW-HIGH:OFFSET',
+            help='standard repeater offset(s) for a band, in MHz (e.g. 450-470:5 or 150.8-162:0.6,1.2); can be specified more than once, and replaces the built-in list of US band plan offsets')
+    argParser.add_argument('--no-csv',action='store_true',
+            help="don't generate the .csv and .otherTables.csv files (comparisons are done in memory either way), and don't launch WinMerge")
+    argParser.add_argument('--report',metavar='FILE',
+            help='write the detailed results (findings and differences, with zone, channel, field, and old/new values) to this file as they are found: NDJSON, or a JSON array if FILE ends in .json; {name} and {dir} in FILE are replaced by the base name and directory of each input file, to write a separate report for each one')
+    argParser.add_argument('--snapshot',metavar='DB',
+            help='also store a normalized snapshot of each export in this SQLite database, for queries with kpgQuery.py (created if it does not exist)')
+    argParser.add_argument('--log',default='kpgCheck.log',metavar='FILE',help='text log file (default: kpgCheck.log)')
+    argParser.add_argument('--append-log',action='store_true',help='append to the log file instead of overwriting it')
+    argParser.add_argument('--run-report',metavar='FILE',
+            help='write a JSON run report with the wall time, CPU time, and memory (resident set size before and after, and the process peak so far) of each phase, and the counts for each file')
+    argParser.add_argument('--trace-memory',action='store_true',
+            help='also measure the peak python memory allocation of each phase, using tracemalloc (slower)')
+    argParser.add_argument('--profile',metavar='PHASE',
+            help='run phases whose names start with PHASE (e.g. parse, extract, csv, check, compare) under cProfile, and write the stats to --profile-output (main process only)')
+    argParser.add_argument('--profile-output',metavar='FILE',help='cProfile stats file for --profile (default: kpgCheck.<PHASE>.prof)')
+    argParser.add_argument('--batch',nargs='+',metavar='PATH',
+            help='batch mode: check every export in these directories or glob patterns, and compare each one against the --reference file')
+    argParser.add_argument('--matrix',nargs='+',metavar='PATH',
+            help='N-way comparison: group the exports in these directories or glob patterns into clusters of identical exports, show which zones differ between clusters, and compare each cluster with the largest one (or the --reference cluster); internal consistency checks are not run')
+    argParser.add_argument('--reference',metavar='FILE',help='reference (golden master) export for batch or watch mode, or the baseline for matrix mode')
+    argParser.add_argument('--jobs',type=int,default=os.cpu_count(),help='number of worker processes for batch and matrix mode (default: number of CPUs)')
+    argParser.add_argument('--watch',nargs='+',metavar='PATH',
+            help='watch mode: keep running, and re-check these exports (files, directories, or glob patterns) each time they change; with --reference, also keep them compared against the reference')
+    argParser.add_argument('--watch-interval',type=float,default=DEFAULT_WATCH_INTERVAL,metavar='SECONDS',
+            help='how often to check the watched files for changes (default: '+str(DEFAULT_WATCH_INTERVAL)+')')
+    args=argParser.parse_args()
+    logging.basicConfig(
+            level=logging.INFO,
+            # format='%(asctime)s %(message)s',
+            format='%(message)s',
+            handlers=[
+                logging.FileHandler(args.log,'a' if args.append_log else 'w'),
+                logging.StreamHandler()
+            ]
+    )
     logging.info('kpgCheck.py - Kenwood data conversion, validation, and comparison tool')
     logging.info('  kpgCheck.py last modified: '+time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(os.path.getmtime(__file__))))
     logging.info('  Run time: '+time.strftime('%Y-%m-%d %H:%M:%S',time.localtime()))
-    file1=sys.argv[1]
-    fileNames=[file1]
-    logging.info('  File 1: '+file1)
-    if len(sys.argv)==3:
-        file2=sys.argv[2]
-        fileNames=[file1,file2]
-        logging.info('  File 2: '+file2)
-    synonymsFile='synonyms.txt'
-    if os.path.isfile(synonymsFile):
+    fileNames=args.fileNames
+    if args.run_report or args.trace_memory or args.profile:
+        runReport=RunReport(traceMemory=args.trace_memory,profilePhase=args.profile)
+    if args.batch:
+        if not args.reference:
+            argParser.error('--batch requires --reference')
+        if fileNames:
+            argParser.error('files cannot be specified with --batch; use --reference and --batch')
+        if args.watch:
+            argParser.error('--batch and --watch cannot be used together')
+        if args.matrix:
+            argParser.error('--batch and --matrix cannot be used together')
+        fileNames=[args.reference]
+    elif args.matrix:
+        if fileNames:
+            argParser.error('files cannot be specified with --matrix')
+        if args.watch:
+            argParser.error('--matrix and --watch cannot be used together')
+        if args.report and '{name}' in args.report:
+            argParser.error('--report cannot have a separate report per file ({name}) with --matrix')
+    elif args.watch:
+        if fileNames:
+            argParser.error('files cannot be specified with --watch; use --watch and optionally --reference')
+        if args.report:
+            argParser.error('--report cannot be used with --watch')
+    elif args.reference:
+        argParser.error('--reference can only be used with --batch, --matrix, or --watch')
+    if len(fileNames)>2:
+        argParser.error('at most two files can be specified')
+    parseCache=None
+    if not args.no_cache or args.clear_cache:
+        parseCache=ParseCache(args.cache_dir,args.cache_size*1024*1024)
+    if args.clear_cache:
+        logging.info('  Cleared '+str(parseCache.clear())+' entries from parse cache '+args.cache_dir)
+        if args.no_cache:
+            parseCache=None
+    if len(fileNames)==0 and not args.watch and not args.matrix:
+        if args.clear_cache:
+            sys.exit(0)
+        argParser.error('at least one file must be specified')
+    if args.batch or (args.watch and args.reference):
+        logging.info('  Reference file: '+args.reference)
+    elif args.matrix and args.reference:
+        logging.info('  Baseline file: '+args.reference)
+    else:
+        for fileNum in range(len(fileNames)):
+            logging.info('  File '+str(fileNum+1)+': '+fileNames[fileNum])
+    synonymsFiles=args.synonyms
+    if synonymsFiles is None:
+        synonymsFiles=[f for f in ['synonyms.txt'] if os.path.isfile(f)]
+    for synonymsFile in synonymsFiles:
         logging.info('  Channel name synonyms file: '+synonymsFile)
 
-    # read synonyms file
-    synonymsList=[] # list of lists
-    with open(synonymsFile,'r') as f:
-        synLines=f.readlines()
-    for line in synLines:
-        if not line.startswith('#'):
-            try:
-                parse=line.split('" "')
-                parse=[x.replace('"','') for x in parse]
-                parse=[x.replace('\n','') for x in parse]
-                synonymsList.append(parse)
-            except:
-                logging.error('Error during parse of '+synonymsFile+' while reading line:')
-                logging.error('  '+line)
-                sys.exit(-1)
-    # logging.info('synonymsList='+str(synonymsList))
-    colKey=[
-         ['Zone Number','Zone#']
-        ,['Zone Name','Zone Name']
-        ,['Channel Number','Chan#']
-        ,['Channel Name','Channel Name']
-        ,['Transmit Frequency [MHz]','TX']
-        ,['Receive Frequency [MHz]','RX']
-        ,['QT/DQT Encode','Enc']
-        ,['QT/DQT Decode','Dec']
-        ,['Channel Spacing (Analog) [kHz]','Spacing']
-        ,['PTT ID (Analog)','PTT ID']
-        ,['Scan Add','Scan Add']
-    ]
+    # read synonyms file(s)
+    try:
+        synonymIndex=SynonymIndex(synonymsFiles)
+    except (OSError,ValueError) as e:
+        logging.error(str(e))
+        sys.exit(-1)
+    if synonymIndex.conflicts:
+        logging.error('  '+str(len(synonymIndex.conflicts))+' channel name(s) appear in more than one synonym set; only the first set is used for each')
 
-    if len(sys.argv)<2 or os.path.splitext(sys.argv[1])[1].lower() not in ['.html','.htm']:
+    for ruleFile in args.rules:
+        logging.info('  Rules file: '+ruleFile)
+        try:
+            loadRuleFile(ruleFile)
+        except Exception as e:
+            logging.error('ERROR loading rules file '+ruleFile+': '+str(e))
+            sys.exit(-1)
+
+    repeaterOffsets=None
+    if args.repeater_offset:
+        try:
+            repeaterOffsets=[parseRepeaterOffset(s) for s in args.repeater_offset]
+        except ValueError as e:
+            argParser.error(str(e))
+    context=CheckContext(synonymIndex,int(round(args.proximity*1000)),repeaterOffsets)
+
+    if args.snapshot:
+        import sqlite3
+        try:
+            SnapshotStore(args.snapshot).close()
+        except (ValueError,sqlite3.Error) as e:
+            logging.error('ERROR opening snapshot database '+args.snapshot+': '+str(e))
+            sys.exit(-1)
+        logging.info('  Snapshot database: '+args.snapshot)
+
+    if fileNames and os.path.splitext(fileNames[0])[1].lower() not in ['.html','.htm']:
         print("ERROR: must specify input .htm or .html filename.")
         sys.exit(-1)
 
-    totalLogLines=[]
+    if args.watch:
+        Watcher(args.watch,context,args.reference,args.parser,parseCache,not args.no_csv,args.watch_interval,args.snapshot).run()
+
+    # the detailed results are streamed to one report (a temporary one if --report is not specified),
+    #  or to one report per input file; the detailed log at the end is rendered from the report(s)
+    perFileReports=bool(args.report) and '{name}' in args.report
+    report=None if perFileReports else ReportWriter(args.report)
+    reports=[report] if report else [] # ReportWriters and report file names, in detailed log order
     kw=[] # list of one or two KWFile objects
     chanFileNames=[]
     otherFileNames=[]
     for fileNum in range(len(fileNames)):
-        srcFileName=fileNames[fileNum]
-        [srcBaseName,srcExtension]=os.path.splitext(srcFileName)
-        chanFileNames.append(srcBaseName+".csv")
-        otherFileNames.append(srcBaseName+".otherTables.csv")
         logging.info('=========================================')
         logging.info('Processing File '+str(fileNum+1))
-        kw.append(KWFile(srcFileName))
-        kpg=kw[fileNum].soup.body.h1.string
-        logging.info('Generating '+chanFileNames[fileNum]+'...')
-        if 'KPG-D1N' not in kpg:
-            logging.error("ERROR: only KPG-D1N html files are currently supported")
+        fileLabel='Reference' if args.batch else 'File '+str(fileNum+1)
+        if perFileReports:
+            report=ReportWriter(reportFileName(args.report,fileNames[fileNum]))
+            reports.append(report)
+        try:
+            [kwFile,chanFileName,otherFileName,discrepancyCounts]=processFile(fileNames[fileNum],fileLabel,context,report,args.parser,parseCache,args.rule_threads,not args.no_csv)
+        except ValueError as e:
+            logging.error('ERROR: '+str(e))
             sys.exit(-1)
-        
-        # generate the channel csv file
-        with open(chanFileNames[fileNum],'w',newline='') as csvFile:
-            csvWriter=csv.writer(csvFile)
-            header=['id']
-            for col in colKey:
-                header.append(col[1])
-            csvWriter.writerow(header)
-            rowNum=1
-            for d in kw[fileNum].getAllChannelDicts():
-                # sort by a list of keys: https://stackoverflow.com/a/21773891
-                # row=sorted(d.items(),key=lambda pair: [h[0] for h in colKey].index(pair[0]))
-                # row=[rowNum]
-                row=[d['Zone Name']+':'+d['Channel Name']] # much more useful for diff than simple row number
-                for h in colKey:
-                    row.append(d[h[0]])
-                csvWriter.writerow(row)
-                rowNum+=1
-            csvWriter.writerow(["## end"])
-        
-        # # generate the Optional Features csv file
-        with open(otherFileNames[fileNum],'w',newline='') as csvFile:
-            csvWriter=csv.writer(csvFile)
-            for [tableName,table] in kw[fileNum].getOptionalFeaturesTables():
-                # logging.info('table:'+str(tableName))
-                # logging.info(str(table))
-                csvWriter.writerow(['Table:'+tableName])
-                for tr in table.find_all('tr'):
-                    row=[]
-                    for item in tr.find_all(['th','td']):
-                        row.append(item.string)
-                    csvWriter.writerow(row)
-                csvWriter.writerow([]) # blank line to separate from next table
+        if args.snapshot:
+            with runReport.phase('snapshot',fileNames[fileNum]):
+                storeSnapshot(args.snapshot,kwFile)
+        kw.append(kwFile)
+        chanFileNames.append(chanFileName)
+        otherFileNames.append(otherFileName)
 
-        logging.info('Done.')
+    ############################################
+    # batch mode: check and compare each radio against the reference, in parallel
+    ############################################
+    if args.batch:
+        batchFiles=[f for f in findBatchFiles(args.batch) if os.path.abspath(f)!=os.path.abspath(args.reference)]
         logging.info('=========================================')
-        logging.info('File '+str(fileNum+1)+': '+fileNames[fileNum])
-        logging.info('INTERNAL CONSISTENCY CHECKS - Summary of discrepancies:')
+        logging.info('Batch mode: '+str(len(batchFiles))+' file(s) to check and compare against the reference, using '+str(args.jobs)+' worker process(es)')
         logging.info('=========================================')
-        totalLogLines.append('-----------------------------------------')
-        totalLogLines.append('INTERNAL CONSISTENCY CHECK for File '+str(fileNum+1)+' : '+fileNames[fileNum])
-        totalLogLines.append('  Part 1: Report all channel names that appear more than once in the html file, and show any discrepancies:')
-        totalLogLines.append('   - channels with the same name should have identical TX/RX/Enc/Dec/Spacing/PTT ID')
-        totalLogLines.append('-----------------------------------------')
-        channelNameDict={} # dict of lists of dicts
-        thisPartDiscrepancyFlag=False
-        keysToCompare=[
-            'Transmit Frequency [MHz]'
-            ,'Receive Frequency [MHz]'
-            ,'QT/DQT Encode'
-            ,'QT/DQT Decode'
-            ,'Channel Spacing (Analog) [kHz]'
-            ,'PTT ID (Analog)']
-        for d in kw[fileNum].getAllChannelDicts():
-            channelNameDict.setdefault(d['Channel Name'],[]).append(d)
-        for channelName in channelNameDict.keys():
-            discrepancyFlag=False
-            logLines=[]
-            l=channelNameDict[channelName]
-            count=len(l)
-            if count>1:
-                # logging.info('Channel "'+channelName+'" appears in multiple entries:')
-                logLines.append('Channel "'+channelName+'" appears in multiple entries:')
-                for i in range(len(l)):
-                    d=l[i]
-                    # logging.info('  Zone '+str(d['Zone Number'])+' ('+d['Zone Name']+')  Channel '+str(d['Channel Number']))
-                    logLines.append('  Zone '+str(d['Zone Number'])+' ('+d['Zone Name']+')  Channel '+str(d['Channel Number']))
-                    if i>0:
-                        d0=l[0]
-                        for key in keysToCompare:
-                            if d[key]!=d0[key]:
-                                discrepancyFlag=True
-                                # logging.info('    *** DISCREPANCY: '+key+': '+d[key]+' is different than '+d0[key]+' in Zone '+str(d0['Zone Number'])+' ('+d0['Zone Name']+')  Channel '+str(d0['Channel Number']))
-                                logLines.append('    *** DISCREPANCY: '+key+': '+d[key]+' is different than '+d0[key]+' in Zone '+str(d0['Zone Number'])+' ('+d0['Zone Name']+')  Channel '+str(d0['Channel Number']))
-            totalLogLines+=logLines
-            if discrepancyFlag:
-                thisPartDiscrepancyFlag=True
-                for line in logLines:
-                    logging.info(line)
-        if not thisPartDiscrepancyFlag:
-            totalLogLines.append('No discrepancies found for this check.')
-
-        # part two: check channels that have all the same TX/RX/Enc/Dec but different name (since same-name is handled in part one)
-        totalLogLines.append('-----------------------------------------')
-        totalLogLines.append('INTERNAL CONSISTENCY CHECK for File '+str(fileNum+1)+' : '+fileNames[fileNum])
-        totalLogLines.append('  Part 2: Report all TX/RX/Enc sets that appear more than once in the html file, and show any discrepancies:')
-        totalLogLines.append('   - channels with the same TX/RX/Enc values should have identical name (or synonym)/Dec/Spacing/PTT ID')
-        totalLogLines.append('-----------------------------------------')
-        tredDict={} # dict of lists of dicts; key syntax = <TX>:<RX>:<Enc>:<Dec>
-        thisPartDiscrepancyFlag=False
-        keysToCompare=[
-            'Channel Name'
-            ,'Channel Spacing (Analog) [kHz]'
-            ,'PTT ID (Analog)']
-        simplexAdditionalKeysToCompare=[
-            'QT/DQT Decode'
-        ]
-        for d in kw[fileNum].getAllChannelDicts():
-            key=str(d['Transmit Frequency [MHz]'])+':'+str(d['Receive Frequency [MHz]'])+':'+str(d['QT/DQT Encode'])
-            tredDict.setdefault(key,[]).append(d)
-        for tredName in tredDict.keys():
-            discrepancyFlag=False
-            logLines=[]
-            l=tredDict[tredName]
-            count=len(l)
-            if count>1:
-                logLines.append('TX/RX/Enc set '+tredName+' appears in multiple entries:')
-                for i in range(len(l)):
-                    d=l[i]
-                    logLines.append('  Zone '+str(d['Zone Number'])+' ('+d['Zone Name']+')  Channel '+str(d['Channel Number'])+' ('+d['Channel Name']+')')
-                    if i>0:
-                        d0=l[0]
-                        if d['Transmit Frequency [MHz]']==d['Receive Frequency [MHz]']:
-                            keyList=keysToCompare+simplexAdditionalKeysToCompare
-                        else:
-                            keyList=keysToCompare
-                        for key in keyList:
-                            if str(d[key]).lower()!=str(d0[key]).lower():
-                                # if key=='Channel Name':
-                                #     logLines.append('  chan='+d[key]+'   synonyms='+str(getSynonyms(d0[key],synonymsList)))
-                                if key=='Channel Name' and d[key] in getSynonyms(d0[key],synonymsList):
-                                    logLines.append('    ** Channel name '+d[key]+' is different than '+d0[key]+' in Zone '+str(d0['Zone Number'])+' ('+d0['Zone Name']+')  Channel '+str(d0['Channel Number'])+' but they are legal synonyms')
-                                else:
-                                    discrepancyFlag=True
-                                    logLines.append('    *** DISCREPANCY: '+key+': '+d[key]+' is different than '+d0[key]+' in Zone '+str(d0['Zone Number'])+' ('+d0['Zone Name']+')  Channel '+str(d0['Channel Number']))
-            totalLogLines+=logLines
-            if discrepancyFlag:
-                thisPartDiscrepancyFlag=True
-                for line in logLines:
-                    logging.info(line)
-        if not thisPartDiscrepancyFlag:
-            totalLogLines.append('No discrepancies found for this check.')
-        
-        # part three: all simplex channels should have dec=None or dec=enc
-        totalLogLines.append('-----------------------------------------')
-        totalLogLines.append('INTERNAL CONSISTENCY CHECK for File '+str(fileNum+1)+' : '+fileNames[fileNum])
-        totalLogLines.append('  Part 3: All simplex channels should have dec=None or dec=enc')
-        totalLogLines.append('-----------------------------------------')
-        thisPartDiscrepancyFlag=False
-        for d in kw[fileNum].getAllChannelDicts():
-            logLines=[]
-            discrepancyFlag=False
-            if d['Transmit Frequency [MHz]']==d['Receive Frequency [MHz]']:
-                enc=d['QT/DQT Encode']
-                dec=d['QT/DQT Decode']
-                if dec!='None' and dec!=enc:
-                    discrepancyFlag=True
-                    logLines.append('Simplex channel enc/dec check:')
-                    logLines.append('  Zone '+str(d['Zone Number'])+' ('+d['Zone Name']+')  Channel '+str(d['Channel Number'])+' ('+d['Channel Name']+')')
-                    logLines.append('    *** DISCREPANCY: Enc = '+str(enc)+'  Dec = '+str(dec))
-            totalLogLines+=logLines
-            if discrepancyFlag:
-                thisPartDiscrepancyFlag=True
-                for line in logLines:
-                    logging.info(line)
-        if not thisPartDiscrepancyFlag:
-            totalLogLines.append('No discrepancies found for this check.')
+        import concurrent.futures
+        import tempfile
+        import shutil
+        cacheDir=args.cache_dir if parseCache else None
+        # without per-file reports, each worker writes its report to a spool file, which is copied into the main report
+        spoolDir=None if perFileReports else tempfile.mkdtemp(prefix='kpgCheck.')
+        batchReportFileNames=[reportFileName(args.report,f) if perFileReports else os.path.join(spoolDir,str(n)+'.ndjson') for n,f in enumerate(batchFiles)]
+        results=[]
+        initargs=(args.rules,args.reference,args.parser,cacheDir,args.cache_size*1024*1024,runReport.enabled,args.trace_memory)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs,initializer=configureBatchWorker,initargs=initargs) as executor:
+            futures=[executor.submit(batchWorker,batchFiles[n],context,args.parser,cacheDir,args.cache_size*1024*1024,batchReportFileNames[n],args.rule_threads,not args.no_csv,args.snapshot) for n in range(len(batchFiles))]
+            for future in concurrent.futures.as_completed(futures):
+                result=future.result()
+                results.append(result)
+                runReport.addPhases(result['phases'])
+                for info in result['files']:
+                    runReport.addFile(info)
+                logging.info('['+str(len(results))+'/'+str(len(batchFiles))+'] '+result['fileName']+' : '+batchResultSummary(result))
+        results.sort(key=lambda r: r['fileName'])
+        deviating=[r for r in results if isDeviating(r)]
+        logging.info('=========================================')
+        logging.info('BATCH SUMMARY: '+str(len(deviating))+' of '+str(len(results))+' radio(s) deviate from the reference or have internal discrepancies')
+        logging.info('  Reference: '+args.reference+' : '+(str(sum(discrepancyCounts))+' internal discrepancies' if sum(discrepancyCounts) else 'no internal discrepancies'))
+        for r in results:
+            logging.info('  '+r['fileName']+' : '+batchResultSummary(r))
+        fileFrequencies={args.reference:sorted(set([hz for [hz,d] in channelFrequencies(kw[0].getAllChannelDicts())]))}
+        for r in results:
+            fileFrequencies[r['fileName']]=r['frequencies']
+        fleetPairs=fleetFrequencyProximity(fileFrequencies,context.proximityHz)
+        logging.info('FLEET FREQUENCY PROXIMITY: '+str(len(fleetPairs))+' pair(s) of distinct frequencies within '+str(args.proximity)+' kHz of each other are used by different radios')
+        for [hz1,hz2,files1,files2] in fleetPairs:
+            logging.info('  '+mhzString(hz1)+' ('+', '.join(files1)+') vs. '+mhzString(hz2)+' ('+', '.join(files2)+') : '+('%.3f' % ((hz2-hz1)/1000))+' kHz apart')
+        for r in results:
+            if perFileReports:
+                reports.append(r['reportFileName'])
+            elif os.path.isfile(r['reportFileName']):
+                for event in reportEvents(r['reportFileName']):
+                    report.write(event)
+        if spoolDir:
+            shutil.rmtree(spoolDir,ignore_errors=True)
+
+    ############################################
+    # matrix mode: cluster the exports by content hash, and compare each cluster with the baseline cluster
+    ############################################
+    if args.matrix:
+        matrixFiles=findBatchFiles(args.matrix)
+        if args.reference and not [f for f in matrixFiles if os.path.abspath(f)==os.path.abspath(args.reference)]:
+            matrixFiles=sorted(matrixFiles+[args.reference])
+        logging.info('=========================================')
+        logging.info('Matrix mode: '+str(len(matrixFiles))+' file(s) to compare, using '+str(args.jobs)+' worker process(es)')
+        logging.info('=========================================')
+        import concurrent.futures
+        import tempfile
+        import shutil
+        cacheDir=args.cache_dir if parseCache else None
+        initargs=(args.rules,None,args.parser,cacheDir,args.cache_size*1024*1024,runReport.enabled,args.trace_memory)
+        spoolDir=tempfile.mkdtemp(prefix='kpgCheck.')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs,initializer=configureBatchWorker,initargs=initargs) as executor:
+            fingerprints=[]
+            for result in executor.map(matrixFingerprintWorker,matrixFiles,*[[v]*len(matrixFiles) for v in [args.parser,cacheDir,args.cache_size*1024*1024]]):
+                runReport.addPhases(result.pop('phases'))
+                for info in result.pop('files'):
+                    runReport.addFile(info)
+                if 'error' in result:
+                    logging.error('ERROR: '+result['fileName']+': '+result['error'])
+                else:
+                    fingerprints.append(result)
+            clusters=clusterFingerprints(fingerprints)
+            baseline=0
+            if args.reference:
+                for n in range(len(clusters)):
+                    if os.path.abspath(args.reference) in [os.path.abspath(f['fileName']) for f in clusters[n]]:
+                        baseline=n
+            logging.info('CLUSTER SUMMARY: '+str(len(fingerprints))+' export(s) in '+str(len(clusters))+' cluster(s) of identical exports; baseline is cluster C'+str(baseline+1))
+            differences={} # cluster number: [zone names,table names] that differ from the baseline cluster
+            for n in range(len(clusters)):
+                cluster=clusters[n]
+                logging.info('  C'+str(n+1)+': '+str(len(cluster))+' export(s), '+str(cluster[0]['channelCount'])+' channels: '+', '.join([f['fileName'] for f in cluster]))
+                if n!=baseline:
+                    differences[n]=fingerprintDifferences(clusters[baseline][0],cluster[0])
+                    [zoneNames,tableNames]=differences[n]
+                    logging.info('      vs. C'+str(baseline+1)+': '+str(len(zoneNames))+' zone(s) with '+str(channelDifferenceCount(clusters[baseline][0],cluster[0],zoneNames))+' channel(s) differ'
+                        +(' ('+', '.join([str(z) for z in zoneNames[:10]])+(', ...' if len(zoneNames)>10 else '')+')' if zoneNames else '')
+                        +('; '+str(len(tableNames))+' other table(s) differ' if tableNames else ''))
+            if len(clusters)>1:
+                logging.info('Zones (+ other tables) that differ between clusters:')
+                for line in clusterMatrixLines(clusters):
+                    logging.info('  '+line)
+            # field-level diffs only where the hashes differ: each cluster's first export vs. the baseline's
+            futures={}
+            for [n,[zoneNames,tableNames]] in differences.items():
+                futures[n]=executor.submit(matrixDiffWorker,clusters[baseline][0]['fileName'],clusters[n][0]['fileName'],zoneNames,tableNames,
+                        'C'+str(baseline+1),'C'+str(n+1),args.parser,cacheDir,args.cache_size*1024*1024,os.path.join(spoolDir,str(n)+'.ndjson'))
+            if futures:
+                logging.info('Field-level comparison with the baseline cluster (differing zones and tables only):')
+            for n in sorted(futures.keys()):
+                result=futures[n].result()
+                runReport.addPhases(result['phases'])
+                if result['error']:
+                    logging.info('  C'+str(n+1)+' : ERROR: '+result['error'])
+                else:
+                    logging.info('  C'+str(n+1)+' : '+('; '.join(comparisonSummaryParts(result,'C'+str(baseline+1))) or 'no differences in the compared fields'))
+                reportFile=os.path.join(spoolDir,str(n)+'.ndjson')
+                if os.path.isfile(reportFile):
+                    for event in reportEvents(reportFile):
+                        report.write(event)
+        shutil.rmtree(spoolDir,ignore_errors=True)
 
     ############################################
     # compare files if second file is specified
     ############################################
     if len(kw)>1:
         logging.info('=========================================')
-        logging.info('File 1 vs File 2: comparison of generated .csv files')
-        logging.info(' File 1 channel tables .csv: '+chanFileNames[0])
-        logging.info(' File 1 other tables .csv: '+otherFileNames[0])
-        logging.info(' File 2 channel tables .csv: '+chanFileNames[1])
-        logging.info(' File 2 other tables .csv: '+otherFileNames[1])
+        logging.info('File 1 vs File 2: comparison of channel and other tables data')
+        if not args.no_csv:
+            logging.info(' File 1 channel tables .csv: '+chanFileNames[0])
+            logging.info(' File 1 other tables .csv: '+otherFileNames[0])
+            logging.info(' File 2 channel tables .csv: '+chanFileNames[1])
+            logging.info(' File 2 other tables .csv: '+otherFileNames[1])
         logging.info('=========================================')
 
-        from csv_diff import load_csv, compare
-        import json
-        csv1=load_csv(open(chanFileNames[0]),key='id')
-        csv2=load_csv(open(chanFileNames[1]),key='id')
-        diff=compare(csv1,csv2)
-        # logging.info(json.dumps(diff,indent=3))
-        if len(diff['added'])>0 or len(diff['removed'])>0:
-            logging.info('Channel(s) were added or removed.  Only the zone:channel pair names are listed here as a summary; the visual diff tool should be used to see more detail.')
-        for addedDict in diff['added']:
-            logging.info('  Added: '+addedDict['id'])
-        for removedDict in diff['removed']:
-            logging.info('  Removed: '+removedDict['id'])
-        for changeDict in diff['changed']:
-            d=csv1[changeDict['key']]
-            logging.info('Zone '+d['Zone#']+' ('+d['Zone Name']+')  Channel '+d['Chan#']+' ('+d['Channel Name']+') : ')
-            for changeKey in changeDict['changes']:
-                changeVal=changeDict['changes'][changeKey]
-                logging.info('  '+changeKey+' : '+changeVal[0]+' (File 1) vs. '+changeVal[1]+' (File 2)')
-
-        # compare .otherTables - just do a quick-and-dirty diff, and show the winmerge if there are any differences
-        with open(otherFileNames[0]) as o1:
-            o1_lines=o1.readlines()
-        with open(otherFileNames[1]) as o2:
-            o2_lines=o2.readlines()
-        import difflib
-        # r=list(difflib.unified_diff(o1_lines,o2_lines,fromfile=otherFileNames[0],tofile=otherFileNames[1]))
-        r=[line for line in list(difflib.Differ().compare(o1_lines,o2_lines)) if not line.startswith(' ')]
-        # logging.info(str(len(r))+' diff result(s):')
-        if len(r)>0:
-            logging.info('Differences were found in the other tables:')
-            for line in r:
-                logging.info(line.rstrip())
+        [channelDiff,tableChanges]=compareFiles(kw[0],kw[1])
+        writeComparison(report,channelDiff,tableChanges,fileNames[0],fileNames[1],log=True)
 
-        logging.info(' ')
-        logging.info('Attempting to launch WinMerge on the generated .csv files...')
         winmerge=r'C:\Program Files (x86)\WinMerge\WinMergeU.exe'
-        if os.path.isfile(winmerge):
+        if not args.no_csv:
+            logging.info(' ')
+            logging.info('Attempting to launch WinMerge on the generated .csv files...')
+        if not args.no_csv and os.path.isfile(winmerge):
             import subprocess
             # Settings/MatchSimilarLines (determined from viewing the exported .ini file) corresponds to
             #  'Align similar lines' in the settings GUI.  This makes for more readable output, by inserting
@@ -391,8 +2709,39 @@ if __name__=="__main__":
 
 
 
-    logging.info('=========================================')
-    logging.info(' ')
-    logging.info('Detailed log, including discrepancies:')
-    for line in totalLogLines:
-        logging.info(line)
+    if not args.watch:
+        logging.info('=========================================')
+        logging.info(' ')
+        logging.info('Detailed log, including discrepancies:')
+        for r in reports:
+            for line in detailedLogLines(r.events() if isinstance(r,ReportWriter) else reportEvents(r)):
+                logging.info(line)
+        for r in reports:
+            if isinstance(r,ReportWriter):
+                r.close()
+        if args.report:
+            logging.info('=========================================')
+            logging.info('Detailed report written to '+(', '.join([r.fileName if isinstance(r,ReportWriter) else r for r in reports])))
+
+    if runReport.enabled:
+        logging.info('=========================================')
+        logging.info('Phase timing summary (total wall seconds, all files):')
+        for [phase,seconds] in runReport.phaseTotals().items():
+            logging.info('  %-28s %10.3f' % (phase,seconds))
+        if args.run_report:
+            import json
+            with open(args.run_report,'w') as f:
+                json.dump(runReport.toDict(),f,indent=2)
+            logging.info('Run report written to '+args.run_report)
+        if runReport.profile:
+            import pstats
+            import io
+            profileOutput=args.profile_output or 'kpgCheck.'+args.profile.replace(':','_')+'.prof'
+            runReport.profile.dump_stats(profileOutput)
+            logging.info('cProfile stats for phase(s) '+args.profile+'* written to '+profileOutput+'; top functions by cumulative time:')
+            buf=io.StringIO()
+            pstats.Stats(runReport.profile,stream=buf).sort_stats('cumulative').print_stats(15)
+            for line in buf.getvalue().splitlines():
+                logging.info(line)
+        elif args.profile:
+            logging.info('No phase name starts with '+args.profile+'; no cProfile stats were collected')
@@ -0,0 +1,241 @@
+# kpgGen - generate synthetic KPG-D1N exported htm files, for testing and benchmarking kpgCheck
+#  without using real (sensitive) codeplugs
+
+# The generated files have the structure that kpgCheck reads: a 'KPG-D1N' h1, some model
+#  information tables, one 'Channel Edit' h1 per channel (two for the first channel of each zone)
+#  followed by its Channel Edit, General, and Analog tables, then an 'Optional Features' h1
+#  followed by h1 headings and tables.
+
+# Channels are drawn from a library of distinct 'master' channels.  A fraction of the channel
+#  slots (duplicateRate) reuse a master channel that already appears elsewhere, as real codeplugs
+#  do for common channels in several zones; some of those reuses are given a synonym name
+#  (synonymRate), and some have one value changed (discrepancyRate), so that kpgCheck's internal
+#  consistency checks have something to find.
+
+# To generate a modified copy of a file for comparison benchmarks, use the same seed and a nonzero
+#  changeRate: the same file is generated, then that fraction of channels (and Optional Features
+#  table rows) is changed, moved, renamed, or deleted.
+
+import os
+import random
+import logging
+from html import escape
+
+# frequency ranges [low MHz, high MHz, step kHz, repeater offset MHz]
+BANDS=[
+    [150.8,162.0,7.5,0.6],
+    [450.0,470.0,12.5,5.0]
+]
+CTCSS_TONES=['67.0','71.9','77.0','82.5','88.5','94.8','100.0','103.5','107.2','110.9','114.8','118.8','123.0',
+    '127.3','131.8','136.5','141.3','146.2','151.4','156.7','162.2','167.9','173.8','179.9','186.2','192.8',
+    '203.5','210.7','218.1','225.7','233.6','241.8','250.3']
+DCS_CODES=['D023N','D025N','D026N','D031N','D032N','D043N','D047N','D051N','D054N','D065N','D071N','D072N',
+    'D073N','D074N','D114N','D115N','D116N','D125N','D131N','D132N','D134N','D143N','D152N','D155N']
+NAME_PREFIXES=['CDF','NCSO','SAR','FIRE','EMS','CHP','USFS','BLM','NOAA','MED','TAC','CMD','LAW','PW','RPTR','DIR']
+OPTIONAL_FEATURES_HEADINGS=['Common','Key Assignment','Scan','Button','Emergency','Signaling','Display','Audio']
+
+class Channel():
+    def __init__(self,name,tx,rx,enc,dec,spacing,pttId):
+        self.name=name
+        self.tx=tx
+        self.rx=rx
+        self.enc=enc
+        self.dec=dec
+        self.spacing=spacing
+        self.pttId=pttId
+
+    def copy(self):
+        return Channel(self.name,self.tx,self.rx,self.enc,self.dec,self.spacing,self.pttId)
+
+def randomChannel(rng,n):
+    [low,high,step,offset]=rng.choice(BANDS)
+    steps=int((high-low)*1000/step)
+    hz=int(round(low*1000000+rng.randrange(steps)*step*1000))
+    tx=rx=hz
+    if rng.random()<0.4 and hz+offset*1000000<=high*1000000: # repeater: transmit on the input frequency
+        tx=int(round(hz+offset*1000000))
+    tone=rng.random()
+    if tone<0.3:
+        enc='None'
+    elif tone<0.85:
+        enc=rng.choice(CTCSS_TONES)
+    else:
+        enc=rng.choice(DCS_CODES)
+    dec=enc if tx!=rx and rng.random()<0.5 else 'None'
+    if tx==rx and enc!='None' and rng.random()<0.5:
+        dec=enc
+    name=rng.choice(NAME_PREFIXES)+' '+str(n)
+    return Channel(name,mhz(tx),mhz(rx),enc,dec,rng.choice(['12.5','12.5','12.5','25.0']),rng.choice(['Off','Off','BOT','EOT']))
+
+def mhz(hz):
+    return '%.5f' % (hz/1000000)
+
+def tableHtml(heading,rows):
+    lines=['<h2>'+escape(heading)+'</h2>','<table border="1">','<tr><th>Item</th><th>Value</th></tr>']
+    for [key,val] in rows:
+        lines.append('<tr><td>'+escape(key)+'</td><td>'+escape(val)+'</td></tr>')
+    lines.append('</table>')
+    return lines
+
+def channelHtml(zoneNum,zoneName,chanNum,c,firstInZone):
+    lines=[]
+    if firstInZone:
+        lines.append('<h1>Channel Edit</h1>')
+    lines.append('<h1>Channel Edit</h1>')
+    lines+=tableHtml('Channel Edit',[
+        ['Zone Number',str(zoneNum)]
+        ,['Zone Name',zoneName]
+        ,['Channel Number',str(chanNum)]
+        ,['Channel Name',c.name]
+        ,['Channel Type','Analog']])
+    lines+=tableHtml('General',[
+        ['Transmit Frequency [MHz]',c.tx]
+        ,['Receive Frequency [MHz]',c.rx]
+        ,['Scan Add','On']
+        ,['Transmit Power','High']
+        ,['Busy Channel Lockout','Off']
+        ,['Talk Around','Disable']
+        ,['Beat Shift','Off']
+        ,['Transmit Inhibit','Off']
+        ,['Compander','Off']
+        ,['Priority Scan','Off']])
+    lines+=tableHtml('Analog',[
+        ['QT/DQT Encode',c.enc]
+        ,['QT/DQT Decode',c.dec]
+        ,['Channel Spacing (Analog) [kHz]',c.spacing]
+        ,['PTT ID (Analog)',c.pttId]
+        ,['Signaling Decode','None']
+        ,['Optional Signaling','None']
+        ,['Scrambler/Encryption','Off']])
+    return lines
+
+# build the codeplug: returns [zones,optionalFeaturesTables,synonymSets] where zones is a list of
+#  [zoneName,list of Channel], optionalFeaturesTables is a list of [heading,rows], and synonymSets is
+#  a list of lists of names
+def buildCodeplug(rng,zones,channelsPerZone,duplicateRate,synonymRate,discrepancyRate,optionalFeaturesTables):
+    library=[]
+    synonymSets={} # master name: list of synonyms
+    zoneList=[]
+    for z in range(zones):
+        channels=[]
+        for n in range(channelsPerZone):
+            if library and rng.random()<duplicateRate:
+                master=rng.choice(library)
+                c=master.copy()
+                r=rng.random()
+                if r<synonymRate:
+                    synonyms=synonymSets.setdefault(master.name,[master.name])
+                    if len(synonyms)<3:
+                        synonyms.append(master.name.replace(' ','_')+chr(ord('A')+len(synonyms)-1))
+                    c.name=rng.choice(synonyms[1:])
+                elif r<synonymRate+discrepancyRate:
+                    field=rng.choice(['dec','spacing','pttId'])
+                    if field=='dec':
+                        c.dec=rng.choice(CTCSS_TONES)
+                    elif field=='spacing':
+                        c.spacing='25.0' if c.spacing=='12.5' else '12.5'
+                    else:
+                        c.pttId='BOT' if c.pttId=='Off' else 'Off'
+            else:
+                c=randomChannel(rng,len(library)+1)
+                library.append(c)
+            channels.append(c)
+        zoneList.append(['Zone '+str(z+1),channels])
+    tables=[]
+    for t in range(optionalFeaturesTables):
+        heading=OPTIONAL_FEATURES_HEADINGS[t%len(OPTIONAL_FEATURES_HEADINGS)]
+        header=['Item','Value'] if heading!='Scan' else ['Number','Zone','Channel']
+        rows=[header]
+        for r in range(rng.randint(5,40)):
+            if heading=='Scan':
+                [zoneName,channels]=rng.choice(zoneList)
+                rows.append([str(r+1),zoneName,rng.choice(channels).name])
+            else:
+                rows.append([heading+' Item '+str(r+1),rng.choice(['On','Off','None','1','2','Enable','Disable'])])
+        tables.append([heading,rows])
+    return [zoneList,tables,list(synonymSets.values())]
+
+# change a fraction of the codeplug: modify, move, rename, or delete channels, and change table cells
+def applyChanges(rng,zoneList,tables,changeRate):
+    allSlots=[[z,n] for z in range(len(zoneList)) for n in range(len(zoneList[z][1]))]
+    deletions=[]
+    for [z,n] in rng.sample(allSlots,int(len(allSlots)*changeRate)):
+        c=zoneList[z][1][n].copy()
+        r=rng.random()
+        if r<0.4:
+            c.pttId='EOT' if c.pttId!='EOT' else 'Off'
+        elif r<0.6:
+            c.name=c.name+' NEW'
+        elif r<0.8 and len(zoneList)>1:
+            zoneList[rng.randrange(len(zoneList))][1].append(c)
+            deletions.append([z,n])
+            continue
+        else:
+            deletions.append([z,n])
+            continue
+        zoneList[z][1][n]=c
+    for [z,n] in sorted(deletions,reverse=True):
+        del zoneList[z][1][n]
+    for [heading,rows] in tables:
+        for row in rows[1:]:
+            if rng.random()<changeRate:
+                row[-1]=row[-1]+' NEW'
+
+def codeplugHtml(zoneList,tables):
+    lines=['<html>','<head><title>KPG-D1N</title></head>','<body>','<h1>KPG-D1N Version 3.02 (synthetic export generated by kpgGen.py)</h1>']
+    lines+=tableHtml('Model Information',[['Model Name','NX-5300'],['Destination','K'],['Frequency Range','450-520 MHz']])
+    for z in range(len(zoneList)):
+        [zoneName,channels]=zoneList[z]
+        for n in range(len(channels)):
+            lines+=channelHtml(z+1,zoneName,n+1,channels[n],n==0)
+    lines.append('<h1>Optional Features</h1>')
+    for [heading,rows] in tables:
+        lines.append('<h1>'+escape(heading)+'</h1>')
+        lines.append('<table border="1">')
+        lines.append('<tr>'+''.join(['<th>'+escape(cell)+'</th>' for cell in rows[0]])+'</tr>')
+        for row in rows[1:]:
+            lines.append('<tr>'+''.join(['<td>'+escape(cell)+'</td>' for cell in row])+'</tr>')
+        lines.append('</table>')
+    lines+=['</body>','</html>']
+    return lines
+
+# write a synthetic export; returns the list of synonym sets used in it
+def generateExport(fileName,zones=10,channelsPerZone=16,duplicateRate=0.3,synonymRate=0.1,discrepancyRate=0.05,
+        optionalFeaturesTables=12,seed=1,changeRate=0.0,synonymsFileName=None):
+    rng=random.Random(seed)
+    [zoneList,tables,synonymSets]=buildCodeplug(rng,zones,channelsPerZone,duplicateRate,synonymRate,discrepancyRate,optionalFeaturesTables)
+    if changeRate:
+        applyChanges(random.Random(seed+1000003),zoneList,tables,changeRate)
+    with open(fileName,'w') as f:
+        for line in codeplugHtml(zoneList,tables):
+            f.write(line+'\n')
+    if synonymsFileName:
+        with open(synonymsFileName,'w') as f:
+            f.write('# synonyms file generated by kpgGen.py\n')
+            for names in synonymSets:
+                f.write(' '.join(['"'+name+'"' for name in names])+'\n')
+    return synonymSets
+
+if __name__=="__main__":
+    logging.basicConfig(level=logging.INFO,format='%(message)s')
+    import argparse
+    argParser=argparse.ArgumentParser(description='Generate a synthetic KPG-D1N exported .htm file.')
+    argParser.add_argument('fileName',metavar='file',help='.htm file to write')
+    argParser.add_argument('--zones',type=int,default=10,help='number of zones (default: 10)')
+    argParser.add_argument('--channels-per-zone',type=int,default=16,help='channels in each zone (default: 16)')
+    argParser.add_argument('--channels',type=int,help='total number of channels; overrides --zones, using --channels-per-zone')
+    argParser.add_argument('--duplicate-rate',type=float,default=0.3,help='fraction of channels that reuse a channel from elsewhere in the file (default: 0.3)')
+    argParser.add_argument('--synonym-rate',type=float,default=0.1,help='fraction of reused channels that use a synonym name (default: 0.1)')
+    argParser.add_argument('--discrepancy-rate',type=float,default=0.05,help='fraction of reused channels with one value changed (default: 0.05)')
+    argParser.add_argument('--optional-features-tables',type=int,default=12,help='number of Optional Features tables (default: 12)')
+    argParser.add_argument('--seed',type=int,default=1,help='random seed (default: 1)')
+    argParser.add_argument('--change-rate',type=float,default=0.0,
+            help='fraction of channels and table rows to change after generating, to make a modified copy of the file generated with the same seed (default: 0)')
+    argParser.add_argument('--synonyms',metavar='FILE',help='also write the synonym sets used in the file to this synonyms file')
+    args=argParser.parse_args()
+    zones=args.zones
+    if args.channels:
+        zones=max(1,-(-args.channels//args.channels_per_zone))
+    generateExport(args.fileName,zones,args.channels_per_zone,args.duplicate_rate,args.synonym_rate,args.discrepancy_rate,
+            args.optional_features_tables,args.seed,args.change_rate,args.synonyms)
+    logging.info('Wrote '+args.fileName+' ('+str(os.path.getsize(args.fileName))+' bytes)')
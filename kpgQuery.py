@@ -0,0 +1,79 @@
+# kpgQuery - store and query normalized snapshots of KPG-D1N exports
+
+# Snapshots are kept in a local SQLite database (see kpgCheck.SnapshotStore), written either by
+#  'kpgQuery.py DB add' or by 'kpgCheck.py --snapshot DB'.  Queries use the database's indexes on
+#  channel name, frequency and tone, so they never parse html, however many snapshots are stored.
+#  By default only the latest snapshot of each radio is searched; use --all to search every snapshot.
+
+import sys
+import logging
+
+import kpgCheck
+
+def channelLine(d):
+    return '%-16s Zone %s (%s)  Channel %s (%s)  TX %s  RX %s  Enc %s  Dec %s' % (d['radio'],d['zoneNumber'],d['zoneName'],
+        d['channelNumber'],d['channelName'],d['fields'].get(kpgCheck.TX_KEY),d['fields'].get(kpgCheck.RX_KEY),d['encTone'],d['decTone'])
+
+def printChannels(channels):
+    for d in channels:
+        print(channelLine(d))
+    print(str(len(channels))+' channel(s) in '+str(len(set([d['radio'] for d in channels])))+' radio(s)')
+
+if __name__=="__main__":
+    # kpgCheck logs its progress messages to the root logger; only show problems
+    logging.basicConfig(level=logging.WARNING,format='%(message)s')
+    import argparse
+    argParser=argparse.ArgumentParser(description='Store and query normalized snapshots of KPG-D1N exports.')
+    argParser.add_argument('db',help='SQLite snapshot database (created if it does not exist)')
+    argParser.add_argument('--all',action='store_true',help='search every stored snapshot, not just the latest one of each radio')
+    commands=argParser.add_subparsers(dest='command',required=True)
+    addParser=commands.add_parser('add',help='parse exports and store a snapshot of each one')
+    addParser.add_argument('fileNames',nargs='+',metavar='file',help='.htm file exported from KPG-D1N')
+    addParser.add_argument('--radio',help='radio name for the snapshot (default: the base name of each file)')
+    addParser.add_argument('--parser',choices=['auto','soup','stream'],default='auto',help='html parser to use (default: auto)')
+    addParser.add_argument('--no-cache',action='store_true',help="don't use kpgCheck's parse cache")
+    commands.add_parser('list',help='list the stored snapshots')
+    channelParser=commands.add_parser('channel',help='every channel with this name, and which radios have it')
+    channelParser.add_argument('name',help='channel name (case-insensitive)')
+    channelParser.add_argument('--synonyms',action='append',metavar='FILE',help='also match legal synonyms of the name from this synonyms file')
+    freqParser=commands.add_parser('freq',help='every channel that transmits or receives on this frequency')
+    freqParser.add_argument('mhz',help='frequency in MHz, e.g. 155.160')
+    freqParser.add_argument('--tolerance',type=float,default=0,metavar='KHZ',help='also match frequencies this close (default: 0)')
+    toneParser=commands.add_parser('tone',help='every channel that uses this Enc or Dec tone')
+    toneParser.add_argument('tone',help='tone as shown in the export, e.g. 156.7 or D023N')
+    args=argParser.parse_args()
+
+    try:
+        store=kpgCheck.SnapshotStore(args.db)
+    except Exception as e:
+        print('ERROR opening snapshot database '+args.db+': '+str(e))
+        sys.exit(-1)
+    latest=not args.all
+    if args.command=='add':
+        cache=None if args.no_cache else kpgCheck.ParseCache()
+        for fileName in args.fileNames:
+            kwFile=kpgCheck.KWFile(fileName,parser=args.parser,cache=cache)
+            if 'KPG-D1N' not in (kwFile.heading or ''):
+                print('ERROR: '+fileName+': only KPG-D1N html files are currently supported')
+                continue
+            [snapshotId,added]=store.add(kwFile,args.radio)
+            print(('Stored ' if added else 'Already stored: ')+fileName+' (snapshot '+str(snapshotId)+')')
+    elif args.command=='list':
+        for s in store.snapshots(latest):
+            print('%5d  %-16s %s  %5d channels  %3d zones  %3d tables  %s' % (s['id'],s['radio'],s['storedTime'],s['channelCount'],s['zoneCount'],s['tableCount'],s['fileName']))
+    elif args.command=='channel':
+        names=[args.name]
+        if args.synonyms:
+            names=kpgCheck.SynonymIndex(args.synonyms).getSynonyms(args.name)
+        channels=store.findChannels(names=names,latest=latest)
+        printChannels(channels)
+        print('Radios with channel '+' / '.join(names)+': '+(', '.join(sorted(set([d['radio'] for d in channels]))) or 'none'))
+    elif args.command=='freq':
+        hz=kpgCheck.frequencyHz(args.mhz)
+        if hz is None:
+            argParser.error('frequency must be in MHz, e.g. 155.160: '+args.mhz)
+        toleranceHz=int(round(args.tolerance*1000))
+        printChannels(store.findChannels(lowHz=hz-toleranceHz,highHz=hz+toleranceHz,latest=latest))
+    elif args.command=='tone':
+        printChannels(store.findChannels(tone=args.tone,latest=latest))
+    store.close()
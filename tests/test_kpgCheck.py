@@ -0,0 +1,235 @@
+# regression tests for kpgCheck, using small exports written with kpgGen's html builder
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kpgCheck
+from kpgGen import Channel,codeplugHtml,generateExport
+
+# write an export with the given zones ([zoneName,list of Channel]) and parse it
+def writeExport(fileName,zoneList):
+    with open(fileName,'w') as f:
+        for line in codeplugHtml(zoneList,[['Common',[['Item','Value'],['Beep','On']]]]):
+            f.write(line+'\n')
+    return kpgCheck.KWFile(str(fileName),parser='stream')
+
+def channel(name,mhz,enc,spacing='12.5'):
+    return Channel(name,mhz,mhz,enc,'None',spacing,'Off')
+
+def test_diffChannelsComparesTonesAcrossFiles(tmp_path):
+    # the two files list the same tones in a different order
+    kwFile1=writeExport(tmp_path/'1.htm',[['Z',[channel('A','155.10000','100.0'),channel('B','155.20000','156.7')]]])
+    kwFile2=writeExport(tmp_path/'2.htm',[['Z',[channel('A','155.10000','156.7'),channel('B','155.20000','100.0')]]])
+    diff=kpgCheck.diffChannels(kwFile1.getAllChannelDicts(),kwFile2.getAllChannelDicts())
+    changes={d.channelName:changes for [d,d2,changes] in diff.changed}
+    assert changes=={
+        'A':{kpgCheck.ENC_KEY:['100.0','156.7']},
+        'B':{kpgCheck.ENC_KEY:['156.7','100.0']}}
+
+def test_diffChannelsIgnoresToneOrder(tmp_path):
+    kwFile1=writeExport(tmp_path/'1.htm',[['Z',[channel('A','155.10000','100.0'),channel('B','155.20000','156.7')]]])
+    kwFile2=writeExport(tmp_path/'2.htm',[['Z',[channel('B','155.20000','156.7'),channel('A','155.10000','100.0')]]])
+    diff=kpgCheck.diffChannels(kwFile1.getAllChannelDicts(),kwFile2.getAllChannelDicts(),fields=[kpgCheck.ENC_KEY,kpgCheck.DEC_KEY])
+    assert diff.isEmpty()
+
+def test_movedChannelIsPairedAcrossFiles(tmp_path):
+    kwFile1=writeExport(tmp_path/'1.htm',[['Z1',[channel('A','155.10000','100.0'),channel('B','155.20000','156.7')]],['Z2',[channel('C','155.30000','D023N')]]])
+    kwFile2=writeExport(tmp_path/'2.htm',[['Z1',[channel('C2','155.30000','D023N'),channel('D','155.40000','162.2')]],['Z2',[channel('C','155.30000','D023N'),channel('B','155.20000','156.7')]]])
+    diff=kpgCheck.diffChannels(kwFile1.getAllChannelDicts(),kwFile2.getAllChannelDicts())
+    assert [[d1.zoneName,d2.zoneName,d1.channelName] for [d1,d2,changes] in diff.moved]==[['Z1','Z2','B']]
+    assert [d.channelName for d in diff.removed]==['A']
+    assert [d.channelName for d in diff.added]==['C2','D']
+
+# the text of each finding of each rule, in a canonical order
+def findingsText(findingsPerRule):
+    return [sorted([tuple(kpgCheck.rules[ruleNum].formatFinding(f)) for f in findingsPerRule[ruleNum]]) for ruleNum in range(len(kpgCheck.rules))]
+
+def test_watchedExportMatchesFullRunAfterEdit(tmp_path):
+    fileName=tmp_path/'watched.htm'
+    export=kpgCheck.WatchedExport(str(fileName))
+    export.update(writeExport(fileName,[['A',[channel('X','155.10000','100.0')]],['B',[channel('Y','155.20000','156.7')]]]),1)
+    # zone A is saved again with a channel that has the same TX/RX/Enc as Y in the unchanged zone B
+    kwFile=writeExport(fileName,[['A',[channel('Z','155.20000','156.7','25.0'),channel('X','155.10000','100.0')]],['B',[channel('Y','155.20000','156.7')]]])
+    [changedZones,touched]=export.update(kwFile,2)
+    assert changedZones==['A']
+    indexes=kpgCheck.ChannelIndexes(kwFile.getAllChannelDicts(),kpgCheck.rules)
+    fullFindings=kpgCheck.runRules(kpgCheck.rules,indexes,kpgCheck.CheckContext())
+    assert findingsText([list(findings.values()) for findings in export.findings])==findingsText(fullFindings)
+    assert export.discrepancyCounts()==[sum([f.discrepancyCount() for f in findings]) for findings in fullFindings]
+    assert sum(export.discrepancyCounts())>0
+
+# an export written by hand with the markup kpgGen doesn't produce
+HAND_WRITTEN_EXPORT='''<html>
+<head><title>KPG-D1N</title></head>
+<body>
+<h1>KPG-D1N Version 3.02 &amp; <b>hand</b> written</h1>
+<h1>Channel Edit</h1>
+<h1>Channel Edit</h1>
+<h2>Channel Edit</h2>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>Zone Number</td><td>1</td></tr>
+<tr><td>Zone Name</td><td>Fire &amp; Rescue</td></tr>
+<tr><td>Channel Number</td><td>1</td></tr>
+<tr><td>Channel Name</td><td><b>TAC <b>1</b></b></td></tr>
+</table>
+<h2>General</h2>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>Transmit Frequency [MHz]</td><td>155.10000</td></tr>
+<tr><td>Receive Frequency [MHz]</td><td>155.10000</td></tr>
+<tr><td>Scan Add</td><td></td></tr>
+<tr><td>Talk Around</td><td><b><b>Disable</b></b></td></tr>
+</table>
+<h2>Analog</h2>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>QT/DQT Encode</td><td>100.0</td></tr>
+<tr><td>QT/DQT Decode</td><td>None</td></tr>
+<tr><td>Channel Spacing (Analog) [kHz]</td><td>12.5</td></tr>
+<tr><td>PTT ID (Analog)</td><td>Off</td></tr>
+</table>
+<h1>Channel Edit</h1>
+<h2>Channel Edit</h2>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>Zone Number</td><td>1</td></tr>
+<tr><td>Zone Name</td><td>Fire &amp; Rescue</td></tr>
+<tr><td>Channel Number</td><td>2</td></tr>
+<tr><td>Channel Name</td><td>A&lt;B&gt;&#67;</td></tr>
+</table>
+<h2>General</h2>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>Transmit Frequency [MHz]</td><td>460.10000</td></tr>
+<tr><td>Receive Frequency [MHz]</td><td>465.10000</td></tr>
+</table>
+<h2>Analog</h2>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>QT/DQT Encode</td><td>D023N</td></tr>
+<tr><td>QT/DQT Decode</td><td>D023N</td></tr>
+</table>
+<h1>Optional Features</h1>
+<h1>Common</h1>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>Beep</td><td>On<br>Off</td></tr>
+<tr><td>Power&nbsp;On Message</td><td></td></tr>
+<tr><td>Short row</td></tr>
+</table>
+<h1>Common</h1>
+<table border="1">
+<tr><th>Item</th><th>Value</th></tr>
+<tr><td>Key <b>A</b></td><td>Scan</td></tr>
+</table>
+</body>
+</html>
+'''
+
+# the two parsers must extract the same data, including from text split across many small feed() chunks
+def test_streamParserMatchesSoupParser(tmp_path,monkeypatch):
+    pytest.importorskip('bs4')
+    generateExport(str(tmp_path/'generated.htm'),zones=3,channelsPerZone=8)
+    (tmp_path/'hand.htm').write_text(HAND_WRITTEN_EXPORT)
+    monkeypatch.setattr(kpgCheck,'STREAM_CHUNK_CHARS',7)
+    for fileName in [tmp_path/'generated.htm',tmp_path/'hand.htm']:
+        soupFile=kpgCheck.KWFile(str(fileName),parser='soup')
+        streamFile=kpgCheck.KWFile(str(fileName),parser='stream')
+        assert len(streamFile.getAllChannelDicts())>0
+        assert [dict(d) for d in streamFile.getAllChannelDicts()]==[dict(d) for d in soupFile.getAllChannelDicts()]
+        assert streamFile.getOptionalFeaturesTables()==soupFile.getOptionalFeaturesTables()
+        assert streamFile.heading==soupFile.heading
+
+def tableChanges(tables1,tables2):
+    return [[c.tableName,c.rowKey,c.column,c.value1,c.value2] for c in kpgCheck.diffOptionalFeatures(tables1,tables2)]
+
+def test_insertedTableRowIsOnlyChange():
+    rows=[['Item','Value'],['Beep','On'],['Backlight','Auto'],['Battery Saver','On']]
+    tables1=[['Common',rows]]
+    tables2=[['Common',rows[:2]+[['Clock','12 h']]+rows[2:3]+[['Battery Saver','Off']]]]
+    assert tableChanges(tables1,tables2)==[
+        ['Common','Clock',None,None,['Clock','12 h']],
+        ['Common','Battery Saver','Value','On','Off']]
+
+def test_duplicateTableRowKeysArePairedInOrder():
+    assert kpgCheck.tableRowKeys([['Key','Function'],['Side','Scan'],['Side','Talk Around'],[],['Side','Monitor']])==[
+        'Key','Side','Side (2)','','Side (3)']
+    tables1=[['Keys',[['Key','Function'],['Side','Scan'],['Side','Talk Around']]]]
+    tables2=[['Keys',[['Key','Function'],['Side','Scan'],['Side','Monitor']]]]
+    assert tableChanges(tables1,tables2)==[['Keys','Side (2)','Function','Talk Around','Monitor']]
+
+def test_tableInOnlyOneFile():
+    rows=[['Item','Value'],['Beep','On']]
+    assert tableChanges([['Common',rows],['Scan',[['Item','Value']]]],[['Common',rows],['Keys',[['Key','Function']]]])==[
+        ['Scan',None,None,[['Item','Value']],None],
+        ['Keys',None,None,None,[['Key','Function']]]]
+
+def test_tableRowLengthMismatch():
+    tables1=[['Common',[['Item','Value'],['Beep','On','Loud']]]]
+    tables2=[['Common',[['Item','Value'],['Beep']]]]
+    assert tableChanges(tables1,tables2)==[
+        ['Common','Beep','Value','On',None],
+        ['Common','Beep','Column 3','Loud',None]]
+
+def test_pairsWithinIncludesExactlyMaxHz():
+    index=kpgCheck.FrequencyIndex([[155100000,'a'],[155106250,'b'],[155112501,'c']])
+    assert index.pairsWithin(6250)==[[155100000,155106250]]
+    assert index.pairsWithin(6251)==[[155100000,155106250],[155106250,155112501]]
+
+def test_pairsWithinSkipsEqualFrequencies():
+    index=kpgCheck.FrequencyIndex([[155100000,'a'],[155100000,'b'],[155200000,'c']])
+    assert index.items[155100000]==['a','b']
+    assert index.pairsWithin(6250)==[]
+
+def test_frequencyProximityRuleReportsCloseNotEqualFrequencies(tmp_path):
+    kwFile=writeExport(tmp_path/'1.htm',[['Z',[channel('A','155.10000','100.0'),channel('B','155.10000','156.7'),
+        channel('C','155.10625','100.0'),channel('D','155.11300','100.0')]]])
+    indexes=kpgCheck.ChannelIndexes(kwFile.getAllChannelDicts(),kpgCheck.rules)
+    findings=kpgCheck.FrequencyProximityRule().check(indexes,kpgCheck.CheckContext())
+    assert sorted([sorted([d.channelName for d in f.records]) for f in findings])==[['A','B','C']]
+
+def test_repeaterOffsetRule(tmp_path):
+    kwFile=writeExport(tmp_path/'1.htm',[['Z',[
+        Channel('STD','455.10000','460.10000','100.0','None','12.5','Off'),
+        Channel('ODD','455.00000','460.60000','100.0','None','12.5','Off'), # 5.6 MHz in the 420-470 MHz band
+        Channel('VHF','155.10000','157.30000','100.0','None','12.5','Off'), # 150-174 MHz has no standard offset
+        channel('SPX','455.20000','100.0')]]])
+    context=kpgCheck.CheckContext()
+    rule=kpgCheck.RepeaterOffsetRule()
+    findings={d.channelName:rule.checkRecord(d,context) for d in kwFile.getAllChannelDicts()}
+    assert [name for [name,f] in findings.items() if f]==['ODD']
+    assert [findings['ODD'].issues[0].value,findings['ODD'].issues[0].refValue]==['5.60000','5.00000']
+
+def test_parseRepeaterOffset():
+    assert kpgCheck.parseRepeaterOffset('450-470:5,3.5')==[450000000,470000000,[5000000,3500000]]
+    for s in ['450-470','450:5','abc-470:5','450-470:','450-470:5,x','-470:5']:
+        with pytest.raises(ValueError):
+            kpgCheck.parseRepeaterOffset(s)
+
+def test_fleetFrequencyProximityOnlyReportsPairsAcrossFiles():
+    fileFrequencies={'a.htm':[155100000,155105000],'b.htm':[155110000,462000000],'c.htm':[462000000]}
+    assert kpgCheck.fleetFrequencyProximity(fileFrequencies,6250)==[[155105000,155110000,['a.htm'],['b.htm']]]
+
+def test_channelTableColumnsRoundTrip():
+    table=kpgCheck.ChannelTable()
+    channelDicts=[{'Channel Name':'CH '+str(n),kpgCheck.TX_KEY:'155.%05d' % n,kpgCheck.RX_KEY:'155.%05d' % n,kpgCheck.ENC_KEY:'100.0'} for n in range(300)]
+    channelDicts[5][kpgCheck.DEC_KEY]=None # a field that only a later channel has, with a cell that has no single string
+    channelDicts[7][kpgCheck.TX_KEY]='bad'
+    for channelDict in channelDicts:
+        table.append(channelDict)
+    table.compact()
+    table.append({'Channel Name':'CH 0',kpgCheck.TX_KEY:'155.00000'}) # appending again after compact
+    channelDicts.append({'Channel Name':'CH 0',kpgCheck.TX_KEY:'155.00000'})
+    restored=kpgCheck.ChannelTable()
+    restored.__setstate__(table.__getstate__())
+    for t in [table,restored]:
+        assert [dict(d) for d in t]==channelDicts
+        assert t[1].txHz==155000010 and t[7].txHz is None and t[-1].rxHz is None
+        assert [t[4].decTone,t[5].decTone]==[kpgCheck.toneCode(None)]*2 and t[4].encTone==kpgCheck.toneCode('100.0')
+        assert kpgCheck.DEC_KEY not in t[4] and t[5][kpgCheck.DEC_KEY] is None
+        assert t[3].key==t[3].key and t[3].key!=t[4].key